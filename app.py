@@ -1,12 +1,15 @@
 import streamlit as st
+import pandas as pd
 import sys
 import os
 
 # Add the scripts directory to the path so we can import RAG_pipeline
 sys.path.append(os.path.join(os.path.dirname(__file__), 'scripts'))
 
-from RAG_pipeline import rag, multi_stage_search, rrf_search
-from llm_eval import llm_eval
+from RAG_pipeline import rag_stream, multi_stage_search, rrf_search, rerank_search, build_filter, query_embedder, reranker
+from clients import warm_up
+from tracing import tracer
+from llm_eval import iter_model_answers, judge
 from Retrieval_evaluation import evaluate_search_functions
 
 # Configure the page
@@ -16,6 +19,20 @@ st.set_page_config(
     layout="wide"
 )
 
+@st.cache_resource(show_spinner="Loading models...")
+def load_resources():
+    # Runs once per server process, not on every rerun, so later queries find the clients built and the models loaded
+    warm_up(query_embedder)
+    try:
+        # Loads the cross-encoder and measures its cost, so the first reranked query stays in budget
+        reranker.warm_up()
+    except Exception as e:
+        print(f"WARNING: Could not load the reranker, reranked queries will load it: {e}")
+    return True
+
+
+load_resources()
+
 # Title and description
 st.title("🌾 Stardew Valley RAG Assistant")
 st.markdown("Ask questions about Stardew Valley and get answers based on the game's wiki!")
@@ -43,6 +60,16 @@ with tab1:
             ["gpt-5-mini", "gpt-5-nano", "gpt-4o-mini", "gpt-4o"],
             index=0
         )
+
+        # Optional scope: searching only tables or one page is cheaper and more precise
+        with st.expander("Search scope"):
+            content_scope = st.radio("Search in:", ["Everything", "Text only", "Tables only"], horizontal=True)
+            page_scope = st.text_input("Only this wiki page (exact title):", placeholder="e.g., Iridium Ore")
+            rerank = st.checkbox(
+                "Rerank with a cross-encoder",
+                value=False,
+                help="Rescores the retrieved candidates on CPU for better ranking, within a fixed latency budget"
+            )
             
         # Submit button
         submit_button = st.button("Get Answer", type="primary")
@@ -51,19 +78,41 @@ with tab1:
         st.header("Answer")
         
         if submit_button and query:
-            with st.spinner("Searching the Stardew Valley wiki and generating answer..."):
-                try:
-                    # Call the RAG pipeline
-                    answer = rag(query, model=model)
-                    
-                    # Display the answer
-                    st.success("Answer generated successfully!")
-                    st.markdown("### Response:")
-                    st.write(answer)
-                    
-                except Exception as e:
-                    st.error(f"An error occurred: {str(e)}")
-                    st.info("Make sure your Qdrant server is running on localhost:6333 and your OpenAI API key is set.")
+            try:
+                st.markdown("### Response:")
+                answer_placeholder = st.empty()
+                stats = {}
+                answer = ""
+
+                # Render the answer as it is generated instead of waiting for the whole response
+                with st.spinner("Searching the Stardew Valley wiki and generating answer..."):
+                    query_filter = build_filter(
+                        content_type={"Text only": "text", "Tables only": "table"}.get(content_scope),
+                        page_title=page_scope.strip() or None,
+                    )
+                    stream = rag_stream(query, model=model, stats=stats, query_filter=query_filter, rerank=rerank)
+                    first_delta = next(stream, "")
+                answer += first_delta
+                answer_placeholder.markdown(answer + "▌")
+                for delta in stream:
+                    answer += delta
+                    answer_placeholder.markdown(answer + "▌")
+                answer_placeholder.markdown(answer)
+
+                st.success("Answer generated successfully!")
+                col_ttft, col_total = st.columns(2)
+                with col_ttft:
+                    st.metric("Time to first token", f"{stats.get('time_to_first_token', 0):.2f}s")
+                with col_total:
+                    st.metric("Total generation time", f"{stats.get('generation_time', 0):.2f}s")
+                if "prompt_tokens" in stats:
+                    st.caption(f"Prompt: {stats['prompt_tokens']} tokens, of which {stats['context_tokens']} retrieved context.")
+                if stats.get("cache_hit"):
+                    st.caption("Served from the answer cache (a similar question retrieved the same context).")
+
+            except Exception as e:
+                st.error(f"An error occurred: {str(e)}")
+                st.info("Make sure your Qdrant server is running on localhost:6333 and your OpenAI API key is set.")
         
         elif submit_button and not query:
             st.warning("Please enter a question first!")
@@ -113,27 +162,43 @@ with tab2:
         st.subheader("Results")
         
         if compare_button and eval_query and selected_models:
-            with st.spinner("Running model comparison and evaluation..."):
-                try:
-                    # Run the evaluation
-                    result = llm_eval(selected_models, eval_query)
-                    
-                    # Display results
-                    st.success("Model comparison completed!")
-                    
-                    # Show individual answers
-                    st.markdown("### Model Answers:")
-                    for model, answer in result["answers"].items():
-                        with st.expander(f"**{model}**"):
-                            st.write(answer)
-                    
-                    # Show judge evaluation
-                    st.markdown("### Judge Evaluation:")
-                    st.info(result["evaluation"])
-                    
-                except Exception as e:
-                    st.error(f"An error occurred: {str(e)}")
-                    st.info("Make sure your Qdrant server is running on localhost:6333 and your OpenAI API key is set.")
+            try:
+                # Every model gets the same prompt at once; each answer is shown as soon as it arrives
+                st.markdown("### Model Answers:")
+                results = []
+                with st.spinner("Retrieving context and asking the models..."):
+                    for result in iter_model_answers(selected_models, eval_query):
+                        results.append(result)
+                        with st.expander(f"**{result['model']}** ({result['latency']:.2f}s)"):
+                            if result["error"] is None:
+                                st.write(result["answer"])
+                            else:
+                                st.error(result["error"])
+
+                # Speed and cost next to the judge's view of quality
+                order = {model: i for i, model in enumerate(selected_models)}
+                results.sort(key=lambda result: order[result["model"]])
+                st.markdown("### Latency and Tokens:")
+                st.dataframe(pd.DataFrame([
+                    {
+                        "Model": result["model"],
+                        "Latency (s)": round(result["latency"], 2),
+                        "Prompt tokens": result["prompt_tokens"],
+                        "Completion tokens": result["completion_tokens"],
+                    }
+                    for result in results
+                ]).set_index("Model"), use_container_width=True)
+
+                with st.spinner("Asking the judge model..."):
+                    evaluation = judge(eval_query, results, judge_model)
+
+                st.success("Model comparison completed!")
+                st.markdown("### Judge Evaluation:")
+                st.info(evaluation)
+
+            except Exception as e:
+                st.error(f"An error occurred: {str(e)}")
+                st.info("Make sure your Qdrant server is running on localhost:6333 and your OpenAI API key is set.")
         
         elif compare_button and not eval_query:
             st.warning("Please enter a question for comparison!")
@@ -157,7 +222,8 @@ with tab3:
         # Search function selection
         search_functions = {
             "RRF Search": ("rrf_search", rrf_search),
-            "Multi-stage Search": ("multi_stage_search", multi_stage_search)
+            "Multi-stage Search": ("multi_stage_search", multi_stage_search),
+            "RRF + Cross-encoder Rerank": ("rerank_search", rerank_search)
         }
         
         selected_functions = st.multiselect(
@@ -185,6 +251,19 @@ with tab3:
             value=5,
             help="Evaluate retrieval performance in top-K results"
         )
+
+        seed = st.number_input(
+            "Sampling seed:",
+            min_value=0,
+            value=42,
+            help="The same seed and sample size reuse the saved evaluation questions instead of generating them again"
+        )
+
+        regenerate = st.checkbox(
+            "Regenerate questions",
+            value=False,
+            help="Ignore the saved evaluation set for this seed and generate new questions"
+        )
         
         # Submit button for evaluation
         eval_button = st.button("Run Retrieval Evaluation", type="primary", key="eval_button")
@@ -205,7 +284,9 @@ with tab3:
                     results = evaluate_search_functions(
                         functions_to_eval, 
                         k=k_value, 
-                        sampleNum=sample_size
+                        sampleNum=sample_size,
+                        seed=seed,
+                        regenerate=regenerate
                     )
                     
                     # Check if evaluation failed
@@ -220,14 +301,14 @@ with tab3:
                     st.markdown("### Evaluation Results:")
                     
                     # Create a results table
-                    import pandas as pd
                     
                     results_data = []
                     for func_name, metrics in results.items():
                         results_data.append({
                             "Search Function": func_name,
                             f"MRR@{k_value}": f"{metrics['MRR']:.3f}",
-                            f"Hit Rate@{k_value}": f"{metrics['HitRate']:.3f}"
+                            f"Hit Rate@{k_value}": f"{metrics['HitRate']:.3f}",
+                            "Latency (ms/query)": f"{metrics['LatencyMs']:.1f}"
                         })
                     
                     df = pd.DataFrame(results_data)
@@ -269,6 +350,16 @@ with tab3:
         else:
             st.info("Select search functions and click 'Run Retrieval Evaluation' to get started!")
 
+# Per-stage latency of the requests served by this process
+with st.sidebar:
+    st.header("⏱️ Latency")
+    latency_rows = tracer.summary()
+    if latency_rows:
+        st.caption("Milliseconds per stage over the last requests (token rows are counts)")
+        st.dataframe(pd.DataFrame(latency_rows).set_index("stage"), use_container_width=True)
+    else:
+        st.caption("Ask a question to collect per-stage timings.")
+
 # Footer
 st.markdown("---")
 st.markdown("**Note:** This assistant uses the Stardew Valley wiki as its knowledge base. Make sure your Qdrant vector database is running and contains the processed wiki data.")
@@ -1,77 +1,368 @@
-from qdrant_client import QdrantClient
 from qdrant_client import models
-from openai import OpenAI
+import asyncio
+import os
+import sqlite3
+import time
+import weakref
+from query_embedding import QueryEmbedder
+from answer_cache import SemanticAnswerCache
+from clients import get_qdrant_client, get_async_qdrant_client, get_openai_client, get_async_openai_client
+from tracing import tracer
+from context_packer import count_tokens, pack_context
+from content_store import CONTENT_STORE_DIR, has_body, open_content_store
+from collection_profiles import get_profile
+from reranker import CrossEncoderReranker
 
 
-qdClient = QdrantClient("http://localhost:6333")
-OpenAIclient = OpenAI()
+# Clients are built on first use and shared (see clients.py), so importing this module is cheap.
+# The old module attributes still resolve to them.
+_CLIENT_ATTRIBUTES = {
+    "qdClient": get_qdrant_client,
+    "aqdClient": get_async_qdrant_client,
+    "OpenAIclient": get_openai_client,
+    "AsyncOpenAIclient": get_async_openai_client,
+}
+
+
+def __getattr__(name):
+    if name in _CLIENT_ATTRIBUTES:
+        return _CLIENT_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Bounds the number of concurrent LLM requests made by the async path
+LLM_MAX_CONCURRENT = int(os.environ.get("LLM_MAX_CONCURRENT", 64))
+_llm_semaphores = weakref.WeakKeyDictionary()
+
+
+def llm_semaphore():
+    """
+    Semaphore of the running event loop; a semaphore is bound to the loop that first waits on it,
+    and every asyncio.run() starts a new loop.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = _llm_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _llm_semaphores[loop] = asyncio.Semaphore(LLM_MAX_CONCURRENT)
+    return semaphore
 
 collection_name="stardew-sparse-and-dense"
 vector_model_handle = "jinaai/jina-embeddings-v2-small-en"
 EMBEDDING_DIMENSIONALITY = 512
 spasrse_model_handle="Qdrant/bm25"
 
+# How many candidates each prefetch stage returns, as a multiple of the final limit
+MULTI_STAGE_PREFETCH_MULTIPLIER = 3
+RRF_PREFETCH_MULTIPLIER = 5
+
+# Must name the profile the collection was built with, so the dense prefetch uses matching
+# search params (HNSW ef, quantization rescoring and oversampling)
+collection_profile = get_profile(os.environ.get("COLLECTION_PROFILE"))
+
+# Token budget of the retrieved context in a prompt, and of any single table within it
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 3000))
+MAX_TABLE_TOKENS = int(os.environ.get("MAX_TABLE_TOKENS", 1000))
+# "markdown" sends the compact tables written at ingestion, "html" the original table HTML
+TABLE_FORMAT = os.environ.get("TABLE_FORMAT", "markdown")
+
+# Qdrant payloads only carry titles and content type when the collection was ingested with a
+# content store; the text and table bodies of the final results are then fetched from it
+content_store = open_content_store(os.environ.get("CONTENT_STORE", os.path.join(CONTENT_STORE_DIR, f"{collection_name}.db")))
+
+# Query vectors are computed once per normalized query and reused by every search function.
+# Set QUERY_EMBEDDING_CACHE to a file path to keep them across restarts.
+query_embedder = QueryEmbedder(
+    vector_model_handle,
+    spasrse_model_handle,
+    max_size=int(os.environ.get("QUERY_EMBEDDING_CACHE_SIZE", 1024)),
+    cache_path=os.environ.get("QUERY_EMBEDDING_CACHE"),
+)
+
+# Optional third stage: a small cross-encoder rescores the fused candidates on CPU. It gets at most
+# RERANK_LATENCY_BUDGET_MS per query and reranks fewer candidates (or none) when that is not enough.
+RERANK_MODEL = os.environ.get("RERANK_MODEL", "Xenova/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.environ.get("RERANK_CANDIDATES", 20))
+reranker = CrossEncoderReranker(
+    RERANK_MODEL,
+    latency_budget_ms=float(os.environ.get("RERANK_LATENCY_BUDGET_MS", 150)),
+)
+
+# Answers are reused for similar questions that retrieve the same context with the same model.
+# Set ANSWER_CACHE to a file path to keep them across restarts.
+answer_cache = SemanticAnswerCache(
+    threshold=float(os.environ.get("ANSWER_CACHE_THRESHOLD", 0.9)),
+    ttl=float(os.environ.get("ANSWER_CACHE_TTL", 7 * 24 * 3600)),
+    max_size=int(os.environ.get("ANSWER_CACHE_SIZE", 10000)),
+    path=os.environ.get("ANSWER_CACHE"),
+)
+
+
+def lookup_answer(cache, query_vector, model, point_ids):
+    """
+    cache.get(), treating a cache error (e.g. a locked SQLite file) as a miss.
+    """
+    try:
+        return cache.get(query_vector, model, point_ids)
+    except sqlite3.Error as e:
+        print(f"WARNING: Answer cache lookup failed: {e}")
+        return None
 
-def multi_stage_search(query ,client=qdClient, collection_name=collection_name,limit= 5):
-    results = client.query_points(
-        collection_name=collection_name,
+
+def store_answer(cache, query_vector, model, point_ids, answer, query):
+    """
+    cache.put(); the answer is already paid for, so a cache error is only logged.
+    """
+    try:
+        cache.put(query_vector, model, point_ids, answer, query=query)
+    except sqlite3.Error as e:
+        print(f"WARNING: Could not store the answer in the answer cache: {e}")
+
+
+def build_filter(content_type=None, page_title=None, section_title=None):
+    """
+    Build a payload filter from optional field values; a list matches any of its values.
+
+    Returns None when no field is given, i.e. search the whole collection.
+    """
+    conditions = []
+    for key, value in (("content_type", content_type), ("page_title", page_title), ("section_title", section_title)):
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            match = models.MatchAny(any=list(value))
+        else:
+            match = models.MatchValue(value=value)
+        conditions.append(models.FieldCondition(key=key, match=match))
+    return models.Filter(must=conditions) if conditions else None
+
+
+def multi_stage_query(dense_vector, sparse_vector, limit=5, prefetch_multiplier=None, query_filter=None):
+    """
+    Build the query_points arguments for dense prefetch followed by a BM25 rerank.
+    """
+    prefetch_multiplier = prefetch_multiplier or MULTI_STAGE_PREFETCH_MULTIPLIER
+    return dict(
         prefetch=[
             models.Prefetch(
-                query=models.Document(
-                    text=query,
-                    model=vector_model_handle,
-                ),
+                query=dense_vector,
                 using="jina-small",
-                # Prefetch three times more results, then
-                # expected to return, so we can really rerank
-                limit=(3 * limit),
+                params=collection_profile.search_params(),
+                # Filters are pushed into every prefetch, so candidates are drawn from matching points only
+                filter=query_filter,
+                # Prefetch more results than expected
+                # to return, so we can really rerank
+                limit=(prefetch_multiplier * limit),
             ),
         ],
-        query=models.Document(
-            text=query,
-            model=spasrse_model_handle, 
-        ),
+        query=sparse_vector,
         using="bm25",
         limit=limit,
         with_payload=True,
     )
 
-    return results.points
-
 
-def rrf_search(query,client =qdClient, collection_name = collection_name , limit = 5):
-    results = client.query_points(
-        collection_name=collection_name,
+def rrf_query(dense_vector, sparse_vector, limit=5, prefetch_multiplier=None, query_filter=None):
+    """
+    Build the query_points arguments for RRF fusion of dense and sparse prefetches.
+    """
+    prefetch_multiplier = prefetch_multiplier or RRF_PREFETCH_MULTIPLIER
+    return dict(
         prefetch=[
             models.Prefetch(
-                query=models.Document(
-                    text=query,
-                    model=vector_model_handle,
-                ),
+                query=dense_vector,
                 using="jina-small",
-                limit=(5 * limit),
+                params=collection_profile.search_params(),
+                filter=query_filter,
+                limit=(prefetch_multiplier * limit),
             ),
             models.Prefetch(
-                query=models.Document(
-                    text=query,
-                    model=spasrse_model_handle,
-                ),
+                query=sparse_vector,
                 using="bm25",
-                limit=(5 * limit),
+                filter=query_filter,
+                limit=(prefetch_multiplier * limit),
             ),
         ],
         # Fusion query enables fusion on the prefetched results
         query=models.FusionQuery(fusion=models.Fusion.RRF),
+        limit=limit,
         with_payload=True,
     )
 
-    return results.points[:limit]
 
+def hydrate(points):
+    """
+    Fill in the text and table bodies of lean search results from the content store.
+    """
+    if content_store is not None:
+        content_store.hydrate(points)
+    elif any(point.payload is not None and not has_body(point.payload) for point in points):
+        # Building prompts from titles alone would send the LLM empty contexts
+        raise RuntimeError(
+            "Search results carry lean payloads but no content store is open; "
+            "copy data/content/<collection>.db from the ingesting host or set CONTENT_STORE"
+        )
+    return points
+
+
+async def ahydrate(points):
+    """
+    hydrate() for the async path; the content store lookup runs in a worker thread.
+    """
+    if content_store is None:
+        # Only checks the payloads, no I/O
+        return hydrate(points)
+    return await asyncio.to_thread(hydrate, points)
+
+
+def multi_stage_search(query ,client=None, collection_name=collection_name,limit= 5, embedder=query_embedder, prefetch_multiplier=None, query_filter=None):
+    if client is None:
+        client = get_qdrant_client()
+    with tracer.span("query_embedding"):
+        dense_vector, sparse_vector = embedder.embed(query)
+    with tracer.span("qdrant"):
+        results = client.query_points(
+            collection_name=collection_name,
+            **multi_stage_query(dense_vector, sparse_vector, limit, prefetch_multiplier, query_filter),
+        )
+
+    return hydrate(results.points)
 
-def build_prompt(question, search_results):
+
+def rrf_search(query,client =None, collection_name = collection_name , limit = 5, embedder=query_embedder, prefetch_multiplier=None, query_filter=None):
+    if client is None:
+        client = get_qdrant_client()
+    with tracer.span("query_embedding"):
+        dense_vector, sparse_vector = embedder.embed(query)
+    with tracer.span("qdrant"):
+        results = client.query_points(
+            collection_name=collection_name,
+            **rrf_query(dense_vector, sparse_vector, limit, prefetch_multiplier, query_filter),
+        )
+
+    return hydrate(results.points[:limit])
+
+
+def multi_stage_search_batch(queries, client=None, collection_name=collection_name, limit=5, embedder=query_embedder, prefetch_multiplier=None, query_filter=None):
+    """
+    Run multi_stage_search for many queries with one batched embedding call and one Qdrant request.
+    """
+    if client is None:
+        client = get_qdrant_client()
+    with tracer.span("query_embedding_batch"):
+        vectors = embedder.embed_many(queries)
+    with tracer.span("qdrant_batch"):
+        responses = client.query_batch_points(
+            collection_name=collection_name,
+            requests=[models.QueryRequest(**multi_stage_query(dense_vector, sparse_vector, limit, prefetch_multiplier, query_filter)) for dense_vector, sparse_vector in vectors],
+        )
+
+    results = [response.points for response in responses]
+    # One content store lookup for the whole batch
+    hydrate([point for points in results for point in points])
+    return results
+
+
+def rrf_search_batch(queries, client=None, collection_name=collection_name, limit=5, embedder=query_embedder, prefetch_multiplier=None, query_filter=None):
+    """
+    Run rrf_search for many queries with one batched embedding call and one Qdrant request.
+    """
+    if client is None:
+        client = get_qdrant_client()
+    with tracer.span("query_embedding_batch"):
+        vectors = embedder.embed_many(queries)
+    with tracer.span("qdrant_batch"):
+        responses = client.query_batch_points(
+            collection_name=collection_name,
+            requests=[models.QueryRequest(**rrf_query(dense_vector, sparse_vector, limit, prefetch_multiplier, query_filter)) for dense_vector, sparse_vector in vectors],
+        )
+
+    results = [response.points[:limit] for response in responses]
+    # One content store lookup for the whole batch
+    hydrate([point for points in results for point in points])
+    return results
+
+
+def rerank_search(query, client=None, collection_name=collection_name, limit=5, embedder=query_embedder, prefetch_multiplier=None, query_filter=None, candidates=RERANK_CANDIDATES, reranker=reranker):
+    """
+    rrf_search for `candidates` points, reranked with the cross-encoder within its latency budget.
+    """
+    results = rrf_search(query, client, collection_name, max(candidates, limit), embedder, prefetch_multiplier, query_filter)
+    with tracer.span("rerank"):
+        return reranker.rerank(query, results)[:limit]
+
+
+def rerank_search_batch(queries, client=None, collection_name=collection_name, limit=5, embedder=query_embedder, prefetch_multiplier=None, query_filter=None, candidates=RERANK_CANDIDATES, reranker=reranker):
+    """
+    Run rerank_search for many queries; retrieval is batched, each query is reranked in its own forward pass.
+    """
+    all_results = rrf_search_batch(queries, client, collection_name, max(candidates, limit), embedder, prefetch_multiplier, query_filter)
+    with tracer.span("rerank_batch"):
+        return [reranker.rerank(query, results)[:limit] for query, results in zip(queries, all_results)]
+
+
+# Let callers such as evaluate_search_functions() find the batch variant of a search function
+multi_stage_search.batch = multi_stage_search_batch
+rrf_search.batch = rrf_search_batch
+rerank_search.batch = rerank_search_batch
+
+
+async def aembed_query(embedder, query):
+    """
+    Query vectors on the event loop: embedders with an `aembed` coroutine (such as
+    query_embedding.MicroBatchEmbedder) are awaited, others run in a worker thread.
+    """
+    aembed = getattr(embedder, "aembed", None)
+    if aembed is not None:
+        return await aembed(query)
+    # Embedding is CPU bound, so it runs in a worker thread to keep the event loop free
+    return await asyncio.to_thread(embedder.embed, query)
+
+
+async def amulti_stage_search(query, client=None, collection_name=collection_name, limit=5, embedder=query_embedder, prefetch_multiplier=None, query_filter=None, query_vectors=None):
+    if client is None:
+        client = get_async_qdrant_client()
+    if query_vectors is None:
+        with tracer.span("query_embedding"):
+            query_vectors = await aembed_query(embedder, query)
+    dense_vector, sparse_vector = query_vectors
+    with tracer.span("qdrant"):
+        results = await client.query_points(
+            collection_name=collection_name,
+            **multi_stage_query(dense_vector, sparse_vector, limit, prefetch_multiplier, query_filter),
+        )
+
+    return await ahydrate(results.points)
+
+
+async def arrf_search(query, client=None, collection_name=collection_name, limit=5, embedder=query_embedder, prefetch_multiplier=None, query_filter=None, query_vectors=None):
+    """
+    Async rrf_search(). Callers that already embedded the query pass its
+    (dense, sparse) `query_vectors` to skip embedding it again.
+    """
+    if client is None:
+        client = get_async_qdrant_client()
+    if query_vectors is None:
+        with tracer.span("query_embedding"):
+            query_vectors = await aembed_query(embedder, query)
+    dense_vector, sparse_vector = query_vectors
+    with tracer.span("qdrant"):
+        results = await client.query_points(
+            collection_name=collection_name,
+            **rrf_query(dense_vector, sparse_vector, limit, prefetch_multiplier, query_filter),
+        )
+
+    return await ahydrate(results.points[:limit])
+
+
+def build_prompt(question, search_results, model=None, token_budget=None, stats=None, table_format=None):
+    """
+    Build the answer prompt from the retrieved chunks, packed into a token budget.
+
+    If a `stats` dict is given, it is filled with the packing stats of
+    pack_context() plus `prompt_tokens`.
+    """
     prompt_template = """
     You're an AI assistant for the players of a computer game named Stardew Valley.
-    Answer the QUESTION based on the CONTEXT extracted from the game's wiki website. Some materials are texts and some are html tables.
+    Answer the QUESTION based on the CONTEXT extracted from the game's wiki website. Some materials are texts and some are tables.
     Use only the materials from the CONTEXT when answering the QUESTION, and don't use your own knowledge of the game.
 
     QUESTION: {question}
@@ -80,37 +371,279 @@ def build_prompt(question, search_results):
     {context}
     """.strip()
 
-    context = ""
-    
-    for doc in search_results:
-        if (doc.payload["content_type"] =="text"):
-            context += (
-            f"Page title: {doc.payload['page_title']}\n"
-            f"Section title: {doc.payload['section_title']}\n"
-            f"Text: {doc.payload['text']}\n\n\n"
-            )
-        elif (doc.payload["content_type"] =="table"):
-            context += (
-            f"Page title: {doc.payload['page_title']}\n"
-            f"Section title: {doc.payload['section_title']}\n"
-            f"Table HTML: {doc.payload['table_html']}\n\n\n"
-            )
+    context, pack_stats = pack_context(
+        search_results,
+        token_budget=token_budget or CONTEXT_TOKEN_BUDGET,
+        max_table_tokens=MAX_TABLE_TOKENS,
+        model=model,
+        table_format=table_format or TABLE_FORMAT,
+    )
+    tracer.record("context_tokens", pack_stats["context_tokens"])
 
     prompt = prompt_template.format(question=question, context=context).strip()
+    if stats is not None:
+        stats.update(pack_stats)
+        stats["prompt_tokens"] = count_tokens(prompt, model)
     return prompt
 
 
-def llm(prompt, model='gpt-5-mini'):
-    response = OpenAIclient.chat.completions.create(
+def llm(prompt, model='gpt-5-mini', stats=None):
+    """
+    Answer a prompt. If a `stats` dict is given, it is filled with the
+    `prompt_tokens` and `completion_tokens` reported by the API.
+    """
+    with tracer.span("llm"):
+        response = get_openai_client().chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}]
+        )
+    if response.usage is not None:
+        tracer.add_tokens(response.usage.prompt_tokens, response.usage.completion_tokens)
+        if stats is not None:
+            stats["prompt_tokens"] = response.usage.prompt_tokens
+            stats["completion_tokens"] = response.usage.completion_tokens
+    
+    return response.choices[0].message.content
+
+
+def rag(query, model='gpt-5-mini', cache=answer_cache, query_filter=None, rerank=False):
+    with tracer.trace("rag", model=model):
+        search = rerank_search if rerank else rrf_search
+        search_results = search(query=query, query_filter=query_filter)
+        point_ids = [doc.id for doc in search_results]
+
+        if cache is not None:
+            # The query vector is already in the embedder's LRU from the search above
+            query_vector = query_embedder.embed(query)[0]
+            answer = lookup_answer(cache, query_vector, model, point_ids)
+            tracer.annotate(cache_hit=answer is not None)
+            if answer is not None:
+                return answer
+
+        with tracer.span("build_prompt"):
+            prompt = build_prompt(query, search_results, model=model)
+        answer = llm(prompt, model=model)
+
+        if cache is not None:
+            store_answer(cache, query_vector, model, point_ids, answer, query)
+        return answer
+
+
+def llm_stream(prompt, model='gpt-5-mini', stats=None):
+    """
+    Yield the answer as text deltas while the model generates it.
+
+    If a `stats` dict is given, it is filled with `time_to_first_token` and
+    `generation_time` (both in seconds, measured from the request) once the
+    stream is exhausted.
+    """
+    start = time.perf_counter()
+    first_token_at = None
+
+    stream = get_openai_client().chat.completions.create(
         model=model,
-        messages=[{"role": "user", "content": prompt}]
+        messages=[{"role": "user", "content": prompt}],
+        stream=True,
+        # The last chunk then carries the token usage
+        stream_options={"include_usage": True},
     )
-    
+
+    for chunk in stream:
+        if getattr(chunk, "usage", None) is not None:
+            tracer.add_tokens(chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        if first_token_at is None:
+            first_token_at = time.perf_counter()
+        yield delta
+
+    end = time.perf_counter()
+    tracer.add_span("llm_first_token", ((first_token_at or end) - start) * 1000)
+    tracer.add_span("llm", (end - start) * 1000)
+    if stats is not None:
+        stats["time_to_first_token"] = (first_token_at or end) - start
+        stats["generation_time"] = end - start
+
+
+def rag_stream(query, model='gpt-5-mini', stats=None, cache=answer_cache, query_filter=None, rerank=False):
+    """
+    Streaming variant of rag(): retrieval runs up front, then the answer is yielded as text deltas.
+
+    If a `stats` dict is given, it is filled with `retrieval_time` and with
+    `time_to_first_token` measured from the start of the call, i.e. the
+    latency the user perceives, plus the LLM-only `generation_time` and
+    whether the answer was served from the answer cache (`cache_hit`) and
+    the `context_tokens` / `prompt_tokens` of the packed prompt.
+    """
+    return tracer.trace_stream("rag_stream", _rag_stream(query, model, stats, cache, query_filter, rerank), model=model)
+
+
+def _rag_stream(query, model='gpt-5-mini', stats=None, cache=answer_cache, query_filter=None, rerank=False):
+    start = time.perf_counter()
+    search = rerank_search if rerank else rrf_search
+    search_results = search(query=query, query_filter=query_filter)
+    point_ids = [doc.id for doc in search_results]
+
+    if cache is not None:
+        query_vector = query_embedder.embed(query)[0]
+        answer = lookup_answer(cache, query_vector, model, point_ids)
+        tracer.annotate(cache_hit=answer is not None)
+        if answer is not None:
+            if stats is not None:
+                stats["retrieval_time"] = stats["time_to_first_token"] = time.perf_counter() - start
+                stats["generation_time"] = 0.0
+                stats["cache_hit"] = True
+            yield answer
+            return
+
+    prompt_stats = {}
+    with tracer.span("build_prompt"):
+        prompt = build_prompt(query, search_results, model=model, stats=prompt_stats)
+    retrieval_time = time.perf_counter() - start
+
+    llm_stats = {}
+    deltas = []
+    for delta in llm_stream(prompt, model=model, stats=llm_stats):
+        deltas.append(delta)
+        yield delta
+
+    if cache is not None:
+        store_answer(cache, query_vector, model, point_ids, "".join(deltas), query)
+
+    if stats is not None:
+        stats["cache_hit"] = False
+        stats["retrieval_time"] = retrieval_time
+        stats["time_to_first_token"] = retrieval_time + llm_stats["time_to_first_token"]
+        stats["generation_time"] = llm_stats["generation_time"]
+        stats["context_tokens"] = prompt_stats["context_tokens"]
+        stats["prompt_tokens"] = prompt_stats["prompt_tokens"]
+
+
+async def arerank_search(query, limit=5, embedder=query_embedder, query_filter=None, candidates=RERANK_CANDIDATES, reranker=reranker, query_vectors=None):
+    """
+    Async rerank_search on the shared async client.
+    """
+    results = await arrf_search(query=query, limit=max(candidates, limit), embedder=embedder, query_filter=query_filter, query_vectors=query_vectors)
+    with tracer.span("rerank"):
+        # The cross-encoder is CPU bound, like query embedding
+        return (await asyncio.to_thread(reranker.rerank, query, results))[:limit]
+
+
+async def allm(prompt, model='gpt-5-mini'):
+    async with llm_semaphore():
+        with tracer.span("llm"):
+            response = await get_async_openai_client().chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}]
+            )
+    if response.usage is not None:
+        tracer.add_tokens(response.usage.prompt_tokens, response.usage.completion_tokens)
+
     return response.choices[0].message.content
 
 
-def rag(query, model='gpt-5-mini'):
-    search_results = rrf_search(client=qdClient,collection_name=collection_name,query=query)
-    prompt = build_prompt(query, search_results)
-    answer = llm(prompt, model=model)
-    return answer
\ No newline at end of file
+async def allm_stream(prompt, model='gpt-5-mini', stats=None):
+    """
+    Async llm_stream(): yield the answer as text deltas while the model generates it.
+    """
+    start = time.perf_counter()
+    first_token_at = None
+
+    async with llm_semaphore():
+        stream = await get_async_openai_client().chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+
+        async for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                tracer.add_tokens(chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            yield delta
+
+    end = time.perf_counter()
+    tracer.add_span("llm_first_token", ((first_token_at or end) - start) * 1000)
+    tracer.add_span("llm", (end - start) * 1000)
+    if stats is not None:
+        stats["time_to_first_token"] = (first_token_at or end) - start
+        stats["generation_time"] = end - start
+
+
+async def arag(query, model='gpt-5-mini', cache=answer_cache, query_filter=None, rerank=False, embedder=query_embedder):
+    with tracer.trace("arag", model=model):
+        # Embedded once, for the search and the answer cache lookup
+        with tracer.span("query_embedding"):
+            query_vectors = await aembed_query(embedder, query)
+        search = arerank_search if rerank else arrf_search
+        search_results = await search(query=query, query_filter=query_filter, query_vectors=query_vectors)
+        point_ids = [doc.id for doc in search_results]
+
+        if cache is not None:
+            query_vector = query_vectors[0]
+            # The cache may be backed by SQLite, so its disk calls stay off the event loop
+            answer = await asyncio.to_thread(lookup_answer, cache, query_vector, model, point_ids)
+            tracer.annotate(cache_hit=answer is not None)
+            if answer is not None:
+                return answer
+
+        with tracer.span("build_prompt"):
+            prompt = build_prompt(query, search_results, model=model)
+        answer = await allm(prompt, model=model)
+
+        if cache is not None:
+            await asyncio.to_thread(store_answer, cache, query_vector, model, point_ids, answer, query)
+        return answer
+
+
+def arag_stream(query, model='gpt-5-mini', cache=answer_cache, query_filter=None, rerank=False, embedder=query_embedder):
+    """
+    Async rag_stream(): retrieval runs up front, then the answer is yielded as text deltas.
+    """
+    return tracer.atrace_stream("arag_stream", _arag_stream(query, model, cache, query_filter, rerank, embedder), model=model)
+
+
+async def _arag_stream(query, model='gpt-5-mini', cache=answer_cache, query_filter=None, rerank=False, embedder=query_embedder):
+    # Embedded once, for the search and the answer cache lookup
+    with tracer.span("query_embedding"):
+        query_vectors = await aembed_query(embedder, query)
+    search = arerank_search if rerank else arrf_search
+    search_results = await search(query=query, query_filter=query_filter, query_vectors=query_vectors)
+    point_ids = [doc.id for doc in search_results]
+
+    if cache is not None:
+        query_vector = query_vectors[0]
+        # The cache may be backed by SQLite, so its disk calls stay off the event loop
+        answer = await asyncio.to_thread(lookup_answer, cache, query_vector, model, point_ids)
+        tracer.annotate(cache_hit=answer is not None)
+        if answer is not None:
+            yield answer
+            return
+
+    with tracer.span("build_prompt"):
+        prompt = build_prompt(query, search_results, model=model)
+
+    deltas = []
+    async for delta in allm_stream(prompt, model=model):
+        deltas.append(delta)
+        yield delta
+
+    if cache is not None:
+        await asyncio.to_thread(store_answer, cache, query_vector, model, point_ids, "".join(deltas), query)
+
+
+async def arag_many(queries, model='gpt-5-mini'):
+    """
+    Answer many questions concurrently on one event loop.
+    """
+    return await asyncio.gather(*(arag(query, model=model) for query in queries))
@@ -1,35 +1,140 @@
 from qdrant_client import QdrantClient
 from qdrant_client import models
-from openai import OpenAI
+from openai import AsyncOpenAI
+import asyncio
+import hashlib
 import json
+import os
 import uuid
 import random 
+import time
 from data_ingest import data_ingestion
+from clients import get_openai_client
+from llm_jobs import RETRY_ERRORS, retry_after, run_async
 
-OpenAIclient = OpenAI()
+# Bump when question_generation_prompt changes, so cached eval sets are regenerated
+QUESTION_PROMPT_VERSION = 1
+MAX_CONCURRENT = 10
+RETRY_LIMIT = 5
+BACKOFF_BASE = 2            # seconds, doubled on every attempt
+
+EVAL_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "eval")
+
+question_generation_prompt = """
+You emulate a player of the Stardew Valley game.
+Here is the text from a wiki page of this game, along with the page and the section it was extracted from.
+Formulate a question that can be answered using these text materials.
+Only return the question. The questions should be complete and concise.
+Page title: {page_title}
+Section title: {section_title}
+Text: {text}\n
+""".strip()
 
 
 def llm(prompt, model='gpt-5-nano'):
     
-    response = OpenAIclient.chat.completions.create(
+    response = get_openai_client().chat.completions.create(
         model=model,
         messages=[{"role": "user", "content": prompt}]
     )
     
     return response.choices[0].message.content
 
-def question_generation(knowledge_base , sampleNum = 10):
-    
-    question_generation_prompt = """
-    You emulate a player of the Stardew Valley game.
-    Here is the text from a wiki page of this game, along with the page and the section it was extracted from.
-    Formulate a question that can be answered using these text materials.
-    Only return the question. The questions should be complete and concise.
-    Page title: {page_title}
-    Section title: {section_title}
-    Text: {text}\n
-    """.strip()
 
+async def generate_question(kb, sem, client, model='gpt-5-nano'):
+    """Generate one question for a chunk with retry + backoff. Returns None after RETRY_LIMIT failures."""
+    prompt = question_generation_prompt.format(page_title=kb["page_title"], section_title=kb["section_title"], text=kb["text"]).strip()
+
+    async with sem:
+        for attempt in range(RETRY_LIMIT):
+            try:
+                response = await client.chat.completions.create(
+                    model=model,
+                    messages=[{"role": "user", "content": prompt}],
+                    timeout=60,
+                )
+                return response.choices[0].message.content.strip()
+
+            except RETRY_ERRORS as e:
+                wait_time = retry_after(e) or BACKOFF_BASE * (2 ** attempt) + random.random()
+                print(f"Rate/API error ({attempt+1}/{RETRY_LIMIT}) for {kb['page_title']}: waiting {wait_time:.1f}s -> {type(e).__name__}")
+                await asyncio.sleep(wait_time)
+
+    return None
+
+
+def _chunk_key(kb):
+    return hashlib.sha256(json.dumps(kb, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def eval_dataset_key(sample_kb, seed, model='gpt-5-nano'):
+    """
+    Version key of an eval set: prompt version, model, seed and the exact sampled chunks.
+    """
+    fingerprint = json.dumps({
+        "prompt_version": QUESTION_PROMPT_VERSION,
+        "model": model,
+        "seed": seed,
+        "chunks": [_chunk_key(kb) for kb in sample_kb],
+    })
+    return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:16]
+
+
+async def question_generation_async(sample_kb, checkpoint_path=None, model='gpt-5-nano', max_concurrent=MAX_CONCURRENT):
+    """
+    Generate questions for the sampled chunks concurrently.
+
+    Every finished question is appended to `checkpoint_path` right away, and
+    chunks already present there are skipped, so an interrupted run resumes
+    where it stopped.
+    """
+    done = {}
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        with open(checkpoint_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn last line from an interrupted run
+                    continue
+                done[entry["key"]] = entry["question"]
+        print(f"INFO: Resuming question generation, {len(done)} of {len(sample_kb)} questions already done")
+
+    sem = asyncio.Semaphore(max_concurrent)
+    checkpoint = open(checkpoint_path, "a", encoding="utf-8") if checkpoint_path else None
+
+    async def one(kb):
+        key = _chunk_key(kb)
+        if key not in done:
+            question = await generate_question(kb, sem, client, model=model)
+            if question is None:
+                return None
+            done[key] = question
+            if checkpoint is not None:
+                checkpoint.write(json.dumps({"key": key, "question": question}, ensure_ascii=False) + "\n")
+                checkpoint.flush()
+        return {**kb, "question": done[key]}
+
+    try:
+        # A client per run: an async client is tied to the event loop it was first used on,
+        # and every run gets a new loop from run_async()
+        async with AsyncOpenAI() as client:
+            results = await asyncio.gather(*(one(kb) for kb in sample_kb))
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
+
+    return results
+
+
+def question_generation(knowledge_base , sampleNum = 10, seed = 42, regenerate = False, eval_dir = EVAL_DATA_DIR, model = 'gpt-5-nano'):
+    """
+    Return a seeded, versioned evaluation set, generating it only when it isn't cached on disk.
+
+    The set is saved as `<eval_dir>/questions_<key>.json`, where the key covers
+    the prompt version, model, seed and sampled chunks. While generating,
+    progress is checkpointed to `questions_<key>.partial.jsonl`.
+    """
     evaluation_questions = []
 
     # Check if we have enough data
@@ -41,14 +146,40 @@ def question_generation(knowledge_base , sampleNum = 10):
         print("ERROR: No data available for sampling.")
         return evaluation_questions
 
-    sample_kb= random.sample(knowledge_base, sampleNum)
+    sample_kb = random.Random(seed).sample(knowledge_base, sampleNum)
+
+    key = eval_dataset_key(sample_kb, seed, model)
+    os.makedirs(eval_dir, exist_ok=True)
+    dataset_path = os.path.join(eval_dir, f"questions_{key}.json")
+    checkpoint_path = os.path.join(eval_dir, f"questions_{key}.partial.jsonl")
 
-    for kb in sample_kb:
-        eval = kb
-        prompt = question_generation_prompt.format(page_title=kb["page_title"], section_title=kb["section_title"],text=kb["text"]).strip()
-        question = llm(prompt)
-        eval["question"] = question
-        evaluation_questions.append(eval)
+    if os.path.exists(dataset_path) and not regenerate:
+        with open(dataset_path, "r", encoding="utf-8") as f:
+            dataset = json.load(f)
+        print(f"SUCCESS: Loaded {len(dataset['questions'])} cached evaluation questions from {dataset_path}")
+        return dataset["questions"]
+
+    if regenerate and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    results = run_async(question_generation_async(sample_kb, checkpoint_path, model=model))
+    evaluation_questions = [result for result in results if result is not None]
+
+    if len(evaluation_questions) < len(sample_kb):
+        print(f"WARNING: {len(sample_kb) - len(evaluation_questions)} questions failed, run again to resume from {checkpoint_path}")
+        return evaluation_questions
+
+    with open(dataset_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "key": key,
+            "prompt_version": QUESTION_PROMPT_VERSION,
+            "model": model,
+            "seed": seed,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "questions": evaluation_questions,
+        }, f, ensure_ascii=False, indent=2)
+    os.remove(checkpoint_path)
+    print(f"SUCCESS: Saved {len(evaluation_questions)} evaluation questions to {dataset_path}")
 
     return evaluation_questions   
 
@@ -80,10 +211,10 @@ def compute_mrr_and_hitrate(results, k=5):
     return mrr, hit_rate
 
 
-def evaluate_search_functions(search_functions, k=5, sampleNum=5):
+def evaluate_search_functions(search_functions, k=5, sampleNum=5, seed=42, regenerate=False):
     knowledge_base, _ = data_ingestion()
 
-    evaluation_dataset = question_generation(knowledge_base, sampleNum)
+    evaluation_dataset = question_generation(knowledge_base, sampleNum, seed=seed, regenerate=regenerate)
     all_results = {}
 
     for item in search_functions:
@@ -97,11 +228,17 @@ def evaluate_search_functions(search_functions, k=5, sampleNum=5):
         print(f"\nEvaluating: {name}")
         results = []
 
-        for dp in evaluation_dataset:
-            query = dp["question"]
-            correct_doc = (dp["page_title"], dp["section_title"])
+        # Use the batch variant when the search function has one: one embedding call and one round trip
+        batch_function = getattr(search_function, "batch", None)
+        start = time.perf_counter()
+        if batch_function is not None:
+            all_search_results = batch_function([dp["question"] for dp in evaluation_dataset])
+        else:
+            all_search_results = [search_function(query=dp["question"]) for dp in evaluation_dataset]
+        latency_ms = (time.perf_counter() - start) * 1000 / max(len(evaluation_dataset), 1)
 
-            search_results = search_function(query=query)
+        for dp, search_results in zip(evaluation_dataset, all_search_results):
+            correct_doc = (dp["page_title"], dp["section_title"])
 
             retrieved_ids = [
                 (doc.payload["page_title"], doc.payload["section_title"])
@@ -111,9 +248,9 @@ def evaluate_search_functions(search_functions, k=5, sampleNum=5):
             results.append((retrieved_ids, correct_doc))
 
         mrr, hit_rate = compute_mrr_and_hitrate(results, k)
-        print(f"{name} → MRR@{k}: {mrr:.3f}, HitRate@{k}: {hit_rate:.3f}")
+        print(f"{name} → MRR@{k}: {mrr:.3f}, HitRate@{k}: {hit_rate:.3f}, {latency_ms:.1f} ms/query")
 
-        all_results[name] = {"MRR": mrr, "HitRate": hit_rate}
+        all_results[name] = {"MRR": mrr, "HitRate": hit_rate, "LatencyMs": latency_ms}
 
     return all_results
 
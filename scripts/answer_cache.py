@@ -0,0 +1,198 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+from typing import Optional, Sequence
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """
+    Cache of generated answers keyed on (query embedding, model, retrieved point ids).
+
+    A lookup is a hit when a cached entry was produced by the same model from
+    the same retrieved context, and its query embedding is within
+    `threshold` cosine similarity of the new query. Entries expire after
+    `ttl` seconds and the least recently used ones are evicted beyond
+    `max_size`. When `path` is given, entries are persisted to SQLite and
+    reloaded on start.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.9,
+        ttl: Optional[float] = 7 * 24 * 3600,
+        max_size: int = 10000,
+        path: Optional[str] = None
+    ):
+        """
+        Args:
+            threshold: Minimum cosine similarity between query embeddings for a hit
+            ttl: Entry lifetime in seconds, or None to keep entries until evicted
+            max_size: Maximum number of cached answers
+            path: Optional SQLite file used to persist entries across restarts
+        """
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_size = max_size
+        self.path = path
+
+        # entry id -> (context key, normalized embedding, answer, created_at)
+        self._entries = OrderedDict()
+        # context key -> set of entry ids, so a lookup only compares queries with identical context
+        self._by_context = {}
+        # Ids of in-memory caches; persisted entries get theirs from SQLite
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.misses = 0
+
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            # Several processes (the app, service workers) may share the file
+            self._db.execute("PRAGMA journal_mode=WAL")
+            with self._db:
+                # Ids are assigned by SQLite, so writers in different processes never collide
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS answers ("
+                    "id INTEGER PRIMARY KEY AUTOINCREMENT, context_key TEXT, embedding BLOB, "
+                    "query TEXT, answer TEXT, created_at REAL, last_used REAL)"
+                )
+            self._load()
+
+    @staticmethod
+    def context_key(model: str, point_ids: Sequence) -> str:
+        """
+        Build the exact-match part of the key from the model and the ranked point ids.
+        """
+        return model + "\x00" + "\x00".join(str(point_id) for point_id in point_ids)
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _transaction(self):
+        # Commits on success and rolls back on error, so a failed write never leaves the file locked
+        return self._db if self._db is not None else nullcontext()
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl is not None and now - created_at > self.ttl
+
+    def _load(self):
+        now = time.time()
+        with self._db:
+            if self.ttl is not None:
+                self._db.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl,))
+            # Apply LRU eviction to whatever was persisted beyond max_size
+            self._db.execute(
+                "DELETE FROM answers WHERE id NOT IN "
+                "(SELECT id FROM answers ORDER BY last_used DESC LIMIT ?)",
+                (self.max_size,)
+            )
+        rows = self._db.execute(
+            "SELECT id, context_key, embedding, answer, created_at FROM answers "
+            "ORDER BY last_used DESC LIMIT ?",
+            (self.max_size,)
+        ).fetchall()
+        # Oldest first, so that the OrderedDict keeps LRU order
+        for entry_id, context_key, embedding, answer, created_at in reversed(rows):
+            self._add(entry_id, context_key, np.frombuffer(embedding, dtype=np.float32), answer, created_at)
+
+    def _add(self, entry_id, context_key, embedding, answer, created_at):
+        self._entries[entry_id] = (context_key, embedding, answer, created_at)
+        self._by_context.setdefault(context_key, set()).add(entry_id)
+
+    def _remove(self, entry_id):
+        context_key = self._entries.pop(entry_id)[0]
+        ids = self._by_context[context_key]
+        ids.discard(entry_id)
+        if not ids:
+            del self._by_context[context_key]
+        if self._db is not None:
+            self._db.execute("DELETE FROM answers WHERE id = ?", (entry_id,))
+
+    def get(self, embedding, model: str, point_ids: Sequence) -> Optional[str]:
+        """
+        Return a cached answer for a similar query over the same context, or None.
+
+        Args:
+            embedding: Dense embedding of the new query
+            model: LLM model name
+            point_ids: Ranked ids of the retrieved points
+
+        Returns:
+            Cached answer string, or None on a miss
+        """
+        context_key = self.context_key(model, point_ids)
+        query_vector = self._normalize(embedding)
+        now = time.time()
+
+        with self._lock, self._transaction():
+            best_id, best_score = None, self.threshold
+            for entry_id in list(self._by_context.get(context_key, ())):
+                _, cached_vector, _, created_at = self._entries[entry_id]
+                if self._expired(created_at, now):
+                    self._remove(entry_id)
+                    continue
+                score = float(np.dot(query_vector, cached_vector))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(best_id)
+            if self._db is not None:
+                self._db.execute("UPDATE answers SET last_used = ? WHERE id = ?", (now, best_id))
+            return self._entries[best_id][2]
+
+    def put(self, embedding, model: str, point_ids: Sequence, answer: str, query: str = ""):
+        """
+        Store an answer generated by `model` for a query over the given context.
+
+        Args:
+            embedding: Dense embedding of the query
+            model: LLM model name
+            point_ids: Ranked ids of the retrieved points
+            answer: Generated answer
+            query: Original question, stored for inspection only
+        """
+        context_key = self.context_key(model, point_ids)
+        vector = self._normalize(embedding)
+        now = time.time()
+
+        with self._lock, self._transaction():
+            if self._db is not None:
+                entry_id = self._db.execute(
+                    "INSERT INTO answers (context_key, embedding, query, answer, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                    (context_key, vector.tobytes(), query, answer, now, now)
+                ).lastrowid
+            else:
+                entry_id = self._next_id
+                self._next_id += 1
+            self._add(entry_id, context_key, vector, answer, now)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        """
+        Drop every cached answer, including the persisted ones.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._by_context.clear()
+            if self._db is not None:
+                with self._db:
+                    self._db.execute("DELETE FROM answers")
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,370 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from data_ingest import iter_data_with_content_types
+from stub_openai import StubOpenAIServer
+
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "benchmarks")
+QUERY_WORDS = 12
+
+
+def latency_stats(latencies: Sequence[float]) -> Dict[str, float]:
+    """
+    Summarize latencies given in seconds as milliseconds.
+    """
+    if not latencies:
+        return {"mean_ms": None, "p50_ms": None, "p95_ms": None, "p99_ms": None}
+    samples = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {
+        "mean_ms": round(float(samples.mean()), 2),
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+    }
+
+
+def sample_queries(
+    num_queries: int,
+    seed: int = 42,
+    texts_path: str = None,
+    tables_path: str = None,
+    questions_path: Optional[str] = None
+) -> List[str]:
+    """
+    Pick benchmark queries without calling an LLM.
+
+    With `questions_path` (an eval set written by question_generation) its
+    questions are used. Otherwise a query is synthesized per sampled chunk
+    from its section title and the first words of its text or summary,
+    which is enough to exercise both the dense and the sparse index.
+    """
+    if questions_path:
+        with open(questions_path, "r", encoding="utf-8") as f:
+            dataset = json.load(f)
+        questions = [item["question"] for item in dataset.get("questions", dataset)]
+        return random.Random(seed).sample(questions, min(num_queries, len(questions)))
+
+    # Reservoir sampling keeps memory flat on a large corpus
+    rng = random.Random(seed)
+    reservoir = []
+    for i, chunk in enumerate(iter_data_with_content_types(texts_path, tables_path)):
+        body = chunk.get("text") or chunk.get("summary") or ""
+        query = f"{chunk.get('section_title', '')} {' '.join(body.split()[:QUERY_WORDS])}".strip()
+        if i < num_queries:
+            reservoir.append(query)
+        else:
+            j = rng.randint(0, i)
+            if j < num_queries:
+                reservoir[j] = query
+    return reservoir
+
+
+def open_backend(
+    backend: str,
+    path: str,
+    collection_name: str,
+    url: str = "http://localhost:6333"
+):
+    """
+    Open (and on first use build) the search backend to benchmark.
+
+    Args:
+        backend: "local-index" for LocalHybridIndex, "qdrant-local" for Qdrant's embedded
+            mode, or "qdrant" for a running server at `url`
+        path: Directory of the local index or of the embedded Qdrant storage
+        collection_name: Collection queried by the search functions
+        url: Qdrant server URL, only used by the "qdrant" backend
+
+    Returns:
+        A client accepted by the `client` argument of the search functions
+    """
+    import RAG_pipeline as pipeline
+
+    if backend == "local-index":
+        from local_index import LocalHybridIndex, build_local_index
+        if os.path.exists(os.path.join(path, "points.jsonl")):
+            return LocalHybridIndex.load(path)
+        print(f"INFO: Building local index at '{path}'")
+        return build_local_index(path)
+
+    from qdrant_client import QdrantClient
+
+    if backend == "qdrant":
+        return QdrantClient(url=url)
+
+    if backend == "qdrant-local":
+        from embedding_store import EmbeddingStore
+        from embedding_workers import EmbeddingPool
+        from table_format import add_compact_tables
+        from vector_store import create_collection, stream_upsert
+
+        client = QdrantClient(path=path)
+        if not client.collection_exists(collection_name) or client.count(collection_name).count == 0:
+            print(f"INFO: Building embedded Qdrant collection at '{path}'")
+            create_collection(client, collection_name, pipeline.EMBEDDING_DIMENSIONALITY)
+            embedding_store = EmbeddingStore("data/embeddings", pipeline.vector_model_handle, pipeline.spasrse_model_handle, pipeline.EMBEDDING_DIMENSIONALITY)
+            with EmbeddingPool(pipeline.vector_model_handle, pipeline.spasrse_model_handle) as embedding_pool:
+                # The embedded client is not safe for concurrent writes
+                chunks = add_compact_tables(iter_data_with_content_types())
+                stream_upsert(client, collection_name, chunks, embedding_pool, upload_concurrency=1, embedding_store=embedding_store)
+        return client
+
+    raise ValueError(f"Unknown backend '{backend}'")
+
+
+def run_load(call: Callable[[Any], Any], items: Sequence[Any], concurrency: int) -> Dict[str, Any]:
+    """
+    Call `call` once per item from `concurrency` threads and time every call.
+
+    Returns:
+        Wall time, per-call latencies in seconds and the number of failed calls
+    """
+    def timed(item):
+        start = time.perf_counter()
+        try:
+            call(item)
+            return time.perf_counter() - start, None
+        except Exception as e:
+            return time.perf_counter() - start, e
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(timed, items))
+    wall_time = time.perf_counter() - start
+
+    errors = [error for _, error in outcomes if error is not None]
+    if errors:
+        print(f"WARNING: {len(errors)} of {len(items)} calls failed, first error: {errors[0]!r}")
+    return {
+        "wall_time": wall_time,
+        "latencies": [latency for latency, error in outcomes if error is None],
+        "errors": len(errors),
+    }
+
+
+def _result_row(name: str, params: Dict[str, Any], num_queries: int, load: Dict[str, Any]) -> Dict[str, Any]:
+    row = {
+        "benchmark": name,
+        **params,
+        "queries": num_queries,
+        "errors": load["errors"],
+        "wall_time_s": round(load["wall_time"], 3),
+        "throughput_qps": round(num_queries / load["wall_time"], 2) if load["wall_time"] else None,
+        **latency_stats(load["latencies"]),
+    }
+    print(
+        f"{name:<20} " + " ".join(f"{k}={v}" for k, v in params.items())
+        + f" -> {row['throughput_qps']} q/s, p50 {row['p50_ms']} ms, p95 {row['p95_ms']} ms, p99 {row['p99_ms']} ms"
+    )
+    return row
+
+
+def benchmark_search(
+    client,
+    queries: List[str],
+    limits: Sequence[int] = (5, 10),
+    prefetch_multipliers: Sequence[Optional[int]] = (None,),
+    batch_sizes: Sequence[int] = (1, 16),
+    concurrency_levels: Sequence[int] = (1, 4, 16)
+) -> List[Dict[str, Any]]:
+    """
+    Measure rrf_search and multi_stage_search over a grid of settings.
+
+    Batch size 1 sends one query per call; larger batch sizes go through the
+    `.batch` variant. Latency is reported per call, throughput in queries per
+    second. The query embedding cache is cleared before each setting, so
+    every query pays for its embedding once, as unique user questions do.
+    """
+    import RAG_pipeline as pipeline
+
+    rows = []
+    for search_function in (pipeline.rrf_search, pipeline.multi_stage_search):
+        for limit in limits:
+            for prefetch_multiplier in prefetch_multipliers:
+                for batch_size in batch_sizes:
+                    for concurrency in concurrency_levels:
+                        pipeline.query_embedder.clear()
+                        options = dict(client=client, collection_name=pipeline.collection_name, limit=limit, prefetch_multiplier=prefetch_multiplier)
+                        if batch_size == 1:
+                            load = run_load(lambda query: search_function(query, **options), queries, concurrency)
+                        else:
+                            batches = [queries[i:i + batch_size] for i in range(0, len(queries), batch_size)]
+                            load = run_load(lambda batch: search_function.batch(batch, **options), batches, concurrency)
+
+                        params = {
+                            "limit": limit,
+                            "prefetch_multiplier": prefetch_multiplier or (
+                                pipeline.RRF_PREFETCH_MULTIPLIER if search_function is pipeline.rrf_search else pipeline.MULTI_STAGE_PREFETCH_MULTIPLIER
+                            ),
+                            "batch_size": batch_size,
+                            "concurrency": concurrency,
+                        }
+                        rows.append(_result_row(search_function.__name__, params, len(queries), load))
+    return rows
+
+
+def benchmark_rag(
+    client,
+    queries: List[str],
+    concurrency_levels: Sequence[int] = (1, 4, 16),
+    time_to_first_token: float = 0.2,
+    time_per_token: float = 0.005,
+    completion_tokens: int = 64,
+    model: str = "gpt-5-mini"
+) -> List[Dict[str, Any]]:
+    """
+    Measure rag() end to end against a local stub of the OpenAI API.
+
+    The answer cache is bypassed, so every call pays for retrieval, prompt
+    building and generation. The per-stage breakdown comes from the tracer.
+    """
+    from openai import OpenAI
+    import RAG_pipeline as pipeline
+    from clients import set_client
+    from tracing import tracer
+
+    rows = []
+    with StubOpenAIServer(time_to_first_token, time_per_token, completion_tokens) as stub:
+        set_client("openai", OpenAI(base_url=stub.base_url, api_key="stub", max_retries=0))
+        set_client("qdrant", client)
+        for concurrency in concurrency_levels:
+            pipeline.query_embedder.clear()
+            tracer.reset()
+            load = run_load(lambda query: pipeline.rag(query, model=model, cache=None), queries, concurrency)
+            row = _result_row("rag", {"concurrency": concurrency}, len(queries), load)
+            row["stages"] = tracer.summary()
+            rows.append(row)
+    return rows
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(
+    backend: str = "local-index",
+    backend_path: str = "data/local_index",
+    num_queries: int = 200,
+    seed: int = 42,
+    limits: Sequence[int] = (5, 10),
+    prefetch_multipliers: Sequence[Optional[int]] = (None,),
+    batch_sizes: Sequence[int] = (1, 16),
+    concurrency_levels: Sequence[int] = (1, 4, 16),
+    include_rag: bool = True,
+    questions_path: Optional[str] = None,
+    output_dir: str = BENCHMARK_DIR,
+    label: str = ""
+) -> str:
+    """
+    Run the search and rag benchmarks and save the results as JSON.
+
+    Args:
+        backend: Search backend, see open_backend()
+        backend_path: Directory of the local index or embedded Qdrant storage
+        num_queries: Number of queries per setting
+        seed: Seed of the query sample
+        limits: Values of `limit` to try
+        prefetch_multipliers: Prefetch multipliers to try, None is the pipeline default
+        batch_sizes: Queries per search call
+        concurrency_levels: Number of concurrent callers
+        include_rag: Also benchmark rag() against the stub LLM server
+        questions_path: Optional eval set to take the queries from
+        output_dir: Directory receiving `benchmark_<timestamp>.json`
+        label: Free-form tag stored with the results, e.g. the change being measured
+
+    Returns:
+        Path of the written results file
+    """
+    import RAG_pipeline as pipeline
+
+    queries = sample_queries(num_queries, seed, questions_path=questions_path)
+    if not queries:
+        raise ValueError("No queries to benchmark, is the knowledge base in data/?")
+
+    client = open_backend(backend, backend_path, pipeline.collection_name)
+
+    # Load the query models before anything is timed
+    pipeline.query_embedder.embed("warm up")
+
+    results = benchmark_search(client, queries, limits, prefetch_multipliers, batch_sizes, concurrency_levels)
+    if include_rag:
+        results += benchmark_rag(client, queries, concurrency_levels)
+
+    run = {
+        "meta": {
+            "label": label,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_commit": _git_commit(),
+            "backend": backend,
+            "num_queries": len(queries),
+            "seed": seed,
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"benchmark_{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(run, f, indent=2)
+    print(f"SUCCESS: Saved {len(results)} benchmark results to {path}")
+    return path
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline latency and throughput benchmark of the retrieval and RAG path")
+    parser.add_argument("--backend", choices=["local-index", "qdrant-local", "qdrant"], default="local-index")
+    parser.add_argument("--backend-path", default=None, help="Local index or embedded Qdrant directory")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--limits", type=_int_list, default=[5, 10])
+    parser.add_argument("--prefetch-multipliers", type=_int_list, default=None)
+    parser.add_argument("--batch-sizes", type=_int_list, default=[1, 16])
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 4, 16])
+    parser.add_argument("--no-rag", action="store_true", help="Skip the rag() benchmark")
+    parser.add_argument("--questions", default=None, help="Eval set JSON to take the queries from")
+    parser.add_argument("--output-dir", default=BENCHMARK_DIR)
+    parser.add_argument("--label", default="")
+    args = parser.parse_args()
+
+    run_benchmark(
+        backend=args.backend,
+        backend_path=args.backend_path or ("data/qdrant_bench" if args.backend == "qdrant-local" else "data/local_index"),
+        num_queries=args.queries,
+        seed=args.seed,
+        limits=args.limits,
+        prefetch_multipliers=args.prefetch_multipliers or [None],
+        batch_sizes=args.batch_sizes,
+        concurrency_levels=args.concurrency,
+        include_rag=not args.no_rag,
+        questions_path=args.questions,
+        output_dir=args.output_dir,
+        label=args.label,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import asyncio
+import inspect
+import os
+import threading
+import weakref
+from typing import Any, Callable, Dict
+
+# Qdrant server, or set LOCAL_INDEX to a directory written by local_index.build_local_index()
+# to search in-process instead
+QDRANT_URL = os.environ.get("QDRANT_URL", "http://localhost:6333")
+# gRPC has less per-request overhead than REST for many small queries
+QDRANT_GRPC = os.environ.get("QDRANT_GRPC", "").lower() in ("1", "true", "yes")
+QDRANT_GRPC_PORT = int(os.environ.get("QDRANT_GRPC_PORT", 6334))
+
+_instances: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+
+def _shared(name: str, factory: Callable[[], Any]) -> Any:
+    # Double-checked, so the common path takes no lock and a client is only ever built once
+    instance = _instances.get(name)
+    if instance is None:
+        with _lock:
+            instance = _instances.get(name)
+            if instance is None:
+                instance = factory()
+                _instances[name] = instance
+    return instance
+
+
+# Event loop -> (async clients built on it, generator closing them). Their connection pools belong to that loop, and
+# every asyncio.run() starts a new one, so async clients are never shared across loops.
+_async_instances = weakref.WeakKeyDictionary()
+
+
+async def _close_with_loop(loop: asyncio.AbstractEventLoop, clients: Dict[str, Any]):
+    # An async generator left open is closed by the loop's shutdown_asyncgens(), which
+    # asyncio.run() calls before closing the loop; that is when the clients are closed
+    try:
+        yield
+    finally:
+        for client in clients.values():
+            close = getattr(client, "close", None)
+            if close is not None:
+                result = close()
+                if inspect.isawaitable(result):
+                    await result
+        # The entry refers to the loop through the clients and this generator, so it is removed by hand
+        _async_instances.pop(loop, None)
+
+
+def _shared_async(name: str, factory: Callable[[], Any]) -> Any:
+    # Clients set with set_client() (stubs in benchmarks) are used on every loop
+    instance = _instances.get(name)
+    if instance is not None:
+        return instance
+    loop = asyncio.get_running_loop()
+    with _lock:
+        entry = _async_instances.get(loop)
+        if entry is None:
+            clients = {}
+            closer = _close_with_loop(loop, clients)
+            # The loop only holds its async generators weakly, so the entry keeps the closer alive
+            entry = _async_instances[loop] = (clients, closer)
+            loop.create_task(closer.__anext__())
+        clients = entry[0]
+        if name not in clients:
+            clients[name] = factory()
+        return clients[name]
+
+
+def set_client(name: str, instance: Any):
+    """
+    Replace a shared client, e.g. with a local index or a stub OpenAI client in benchmarks.
+
+    Args:
+        name: One of "qdrant", "async_qdrant", "openai", "async_openai"
+        instance: Client used from now on
+    """
+    with _lock:
+        _instances[name] = instance
+
+
+def get_qdrant_client():
+    """
+    Shared Qdrant client, or the local index when LOCAL_INDEX is set. Built on first use.
+    """
+    def build():
+        if os.environ.get("LOCAL_INDEX"):
+            from local_index import LocalHybridIndex
+            return LocalHybridIndex.load(os.environ["LOCAL_INDEX"])
+        from qdrant_client import QdrantClient
+        return QdrantClient(url=QDRANT_URL, prefer_grpc=QDRANT_GRPC, grpc_port=QDRANT_GRPC_PORT)
+    return _shared("qdrant", build)
+
+
+def get_async_qdrant_client():
+    """
+    Async Qdrant client of the running event loop, for arag(); it shares no connections with the sync one.
+    """
+    # Resolved before _shared() takes the lock, which get_qdrant_client() needs too
+    local_index = get_qdrant_client() if os.environ.get("LOCAL_INDEX") else None
+
+    def build():
+        if local_index is not None:
+            from local_index import AsyncLocalHybridIndex
+            return AsyncLocalHybridIndex(local_index)
+        from qdrant_client import AsyncQdrantClient
+        return AsyncQdrantClient(url=QDRANT_URL, prefer_grpc=QDRANT_GRPC, grpc_port=QDRANT_GRPC_PORT)
+    return _shared_async("async_qdrant", build)
+
+
+def get_openai_client():
+    """
+    Shared OpenAI client; its connection pool is reused by every request.
+    """
+    def build():
+        from openai import OpenAI
+        return OpenAI()
+    return _shared("openai", build)
+
+
+def get_async_openai_client():
+    """
+    AsyncOpenAI client of the running event loop, closed when the loop shuts down.
+    """
+    def build():
+        from openai import AsyncOpenAI
+        return AsyncOpenAI()
+    return _shared_async("async_openai", build)
+
+
+def warm_up(embedder=None):
+    """
+    Build the clients and load the query models up front, so the first question isn't slow.
+
+    Connection problems are reported but not raised, so an app can still start
+    and show its own error when a query is made.
+
+    Args:
+        embedder: Optional QueryEmbedder whose models are loaded with one dummy query
+    """
+    if embedder is not None:
+        embedder.warm_up()
+    get_openai_client()
+    qdClient = get_qdrant_client()
+    # The local index has no server to connect to
+    if not hasattr(qdClient, "get_collections"):
+        return
+    try:
+        # Opens the connection (and checks the server is reachable) before the first query
+        qdClient.get_collections()
+    except Exception as e:
+        print(f"WARNING: Could not reach Qdrant at {QDRANT_URL}: {e}")
@@ -0,0 +1,126 @@
+from dataclasses import dataclass, replace
+from typing import Dict, Optional
+
+from qdrant_client import models
+
+
+@dataclass(frozen=True)
+class CollectionProfile:
+    """
+    Storage and index settings of a collection, with the search params that go with them.
+
+    Attributes:
+        name: Profile name, used in collection names and reports
+        quantization: None, "scalar" (int8) or "binary" quantization of the dense vectors
+        always_ram: Keep the quantized vectors in RAM even when the originals are on disk
+        rescore: Rescore quantized candidates with the original vectors
+        oversampling: Candidates fetched per result before rescoring
+        hnsw_m: Edges per node of the HNSW graph, None keeps Qdrant's default (16)
+        hnsw_ef_construct: Build-time candidate list size, None keeps Qdrant's default (100)
+        hnsw_ef: Search-time candidate list size, None lets Qdrant choose
+        on_disk_vectors: Keep the original dense vectors (and the sparse index) on disk
+        on_disk_payload: Keep payloads on disk
+    """
+    name: str = "default"
+    quantization: Optional[str] = None
+    always_ram: bool = True
+    rescore: bool = True
+    oversampling: Optional[float] = None
+    hnsw_m: Optional[int] = None
+    hnsw_ef_construct: Optional[int] = None
+    hnsw_ef: Optional[int] = None
+    on_disk_vectors: bool = False
+    on_disk_payload: bool = False
+
+    def vector_params(self, embedding_dimensionality: int) -> models.VectorParams:
+        """
+        Dense vector config, with the HNSW and quantization settings of the profile.
+        """
+        hnsw_config = None
+        if self.hnsw_m is not None or self.hnsw_ef_construct is not None:
+            hnsw_config = models.HnswConfigDiff(m=self.hnsw_m, ef_construct=self.hnsw_ef_construct)
+
+        return models.VectorParams(
+            size=embedding_dimensionality,
+            distance=models.Distance.COSINE,
+            hnsw_config=hnsw_config,
+            quantization_config=self.quantization_config(),
+            on_disk=self.on_disk_vectors or None,
+        )
+
+    def sparse_vector_params(self) -> models.SparseVectorParams:
+        return models.SparseVectorParams(
+            index=models.SparseIndexParams(on_disk=True) if self.on_disk_vectors else None,
+            modifier=models.Modifier.IDF,
+        )
+
+    def quantization_config(self):
+        if self.quantization == "scalar":
+            return models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8,
+                quantile=0.99,
+                always_ram=self.always_ram,
+            ))
+        if self.quantization == "binary":
+            return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=self.always_ram))
+        if self.quantization is not None:
+            raise ValueError(f"Unknown quantization '{self.quantization}'")
+        return None
+
+    def search_params(self) -> Optional[models.SearchParams]:
+        """
+        Search params for queries against a collection built with this profile, None if the defaults apply.
+        """
+        quantization = None
+        if self.quantization is not None:
+            quantization = models.QuantizationSearchParams(rescore=self.rescore, oversampling=self.oversampling)
+        if quantization is None and self.hnsw_ef is None:
+            return None
+        return models.SearchParams(hnsw_ef=self.hnsw_ef, quantization=quantization)
+
+    def estimated_ram_bytes(self, num_points: int, embedding_dimensionality: int) -> int:
+        """
+        Rough RAM needed for the dense vectors and the HNSW graph, as in Qdrant's capacity planning guide.
+
+        Sparse vectors and payloads are left out; they are the same for
+        every profile unless moved to disk.
+        """
+        m = self.hnsw_m or 16
+        # Layer 0 has 2 * m links of 4 bytes per node, the upper layers add little
+        graph = num_points * 2 * m * 4
+        originals = 0 if self.on_disk_vectors else num_points * embedding_dimensionality * 4
+        quantized = 0
+        if self.quantization == "scalar" and self.always_ram:
+            quantized = num_points * embedding_dimensionality
+        elif self.quantization == "binary" and self.always_ram:
+            quantized = num_points * embedding_dimensionality // 8
+        return originals + quantized + graph
+
+
+_DEFAULT = CollectionProfile()
+
+COLLECTION_PROFILES: Dict[str, CollectionProfile] = {
+    profile.name: profile
+    for profile in (
+        _DEFAULT,
+        # int8 vectors in RAM, originals on disk for rescoring: about 4x less RAM for vectors
+        replace(_DEFAULT, name="scalar", quantization="scalar", oversampling=2.0, on_disk_vectors=True),
+        # 1 bit per dimension: about 32x less RAM for vectors, needs more oversampling
+        replace(_DEFAULT, name="binary", quantization="binary", oversampling=3.0, on_disk_vectors=True),
+        # Denser graph and larger candidate lists: higher recall for more RAM and latency
+        replace(_DEFAULT, name="high-recall", hnsw_m=32, hnsw_ef_construct=256, hnsw_ef=128),
+        # Everything but the HNSW graph on disk, for small machines
+        replace(_DEFAULT, name="on-disk", on_disk_vectors=True, on_disk_payload=True),
+    )
+}
+
+
+def get_profile(name: Optional[str]) -> CollectionProfile:
+    """
+    Look up a profile by name; None or an empty name gives the default profile.
+    """
+    if not name:
+        return _DEFAULT
+    if name not in COLLECTION_PROFILES:
+        raise ValueError(f"Unknown collection profile '{name}', expected one of {sorted(COLLECTION_PROFILES)}")
+    return COLLECTION_PROFILES[name]
@@ -0,0 +1,122 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+# Default directory of the content stores, one `<collection_name>.db` per collection
+CONTENT_STORE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "content")
+# Payload fields kept in Qdrant; everything else lives in the content store
+LEAN_PAYLOAD_FIELDS = ("page_title", "section_title", "content_type")
+# Stays below SQLite's limit on bound parameters per statement
+MAX_IDS_PER_QUERY = 500
+
+
+def split_payload(chunk: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Split a chunk into the lean payload stored in Qdrant and the heavy fields kept locally.
+    """
+    lean = {key: value for key, value in chunk.items() if key in LEAN_PAYLOAD_FIELDS}
+    heavy = {key: value for key, value in chunk.items() if key not in LEAN_PAYLOAD_FIELDS}
+    return lean, heavy
+
+
+class ContentStore:
+    """
+    SQLite store of the heavy chunk fields (text, table_html, table_markdown, summary) by point id.
+
+    Qdrant then only holds titles and content type, so prefetch candidates
+    and responses stay small, and the bodies of the final top-k are fetched
+    here in one query.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: SQLite file holding the chunk bodies
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS content (id TEXT PRIMARY KEY, body TEXT)")
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM content").fetchone()[0]
+
+    def put_many(self, items: Iterable[Tuple[Any, Dict[str, Any]]]):
+        """
+        Insert or replace the heavy fields of many points.
+
+        Args:
+            items: (point id, heavy fields) pairs
+        """
+        rows = [(str(point_id), json.dumps(fields, ensure_ascii=False)) for point_id, fields in items]
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO content (id, body) VALUES (?, ?)", rows)
+            self._db.commit()
+
+    def get_many(self, point_ids: Sequence[Any]) -> Dict[str, Dict[str, Any]]:
+        """
+        Fetch the heavy fields of many points in one query.
+
+        Returns:
+            Point id (as a string) -> heavy fields, for the ids that are stored
+        """
+        ids = [str(point_id) for point_id in point_ids]
+        rows = []
+        with self._lock:
+            for i in range(0, len(ids), MAX_IDS_PER_QUERY):
+                chunk = ids[i:i + MAX_IDS_PER_QUERY]
+                rows += self._db.execute(
+                    f"SELECT id, body FROM content WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+        return {point_id: json.loads(body) for point_id, body in rows}
+
+    def ids(self) -> Set[str]:
+        with self._lock:
+            return {row[0] for row in self._db.execute("SELECT id FROM content")}
+
+    def delete_many(self, point_ids: Sequence[Any]):
+        with self._lock:
+            self._db.executemany("DELETE FROM content WHERE id = ?", [(str(point_id),) for point_id in point_ids])
+            self._db.commit()
+
+    def hydrate(self, points: List[Any]) -> List[Any]:
+        """
+        Merge the stored heavy fields into the payloads of scored points, in place.
+
+        Points whose payload already carries a body (collections ingested with
+        full payloads) are left alone.
+        """
+        lean = [point for point in points if point.payload is not None and not has_body(point.payload)]
+        if lean:
+            bodies = self.get_many([point.id for point in lean])
+            missing = 0
+            for point in lean:
+                body = bodies.get(str(point.id))
+                if body is None:
+                    missing += 1
+                    continue
+                point.payload.update(body)
+            if missing:
+                print(f"WARNING: {missing} of {len(lean)} search results have no body in {self.path}; is it the store of this collection?")
+        return points
+
+
+def has_body(payload: Dict[str, Any]) -> bool:
+    return "text" in payload or "table_html" in payload
+
+
+def open_content_store(path: Optional[str]) -> Optional[ContentStore]:
+    """
+    Open the content store at `path` if it exists, so collections with full payloads keep working without one.
+    """
+    if path and os.path.exists(path):
+        return ContentStore(path)
+    if path:
+        print(f"WARNING: No content store at {path}; search results of a collection ingested with lean payloads will fail to hydrate")
+    return None
@@ -0,0 +1,192 @@
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Used when the model name is unknown to tiktoken (the GPT-4o / GPT-5 family encoding)
+DEFAULT_ENCODING = "o200k_base"
+# Rough characters per token, only used when tiktoken is not installed
+CHARS_PER_TOKEN = 4
+# Text is truncated to fill the rest of the budget only when at least this much room is left
+MIN_TRUNCATED_TOKENS = 64
+TRUNCATION_MARK = " [...]"
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: Optional[str]):
+    try:
+        import tiktoken
+    except ImportError:
+        print("WARNING: tiktoken is not installed, token counts are approximated from character counts")
+        return None
+    try:
+        return tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding(DEFAULT_ENCODING)
+    except KeyError:
+        return tiktoken.get_encoding(DEFAULT_ENCODING)
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """
+    Count the tokens of `text` with the tokenizer of `model`.
+    """
+    encoding = _encoding(model)
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, model: Optional[str] = None) -> str:
+    """
+    Cut `text` to at most `max_tokens` tokens.
+    """
+    encoding = _encoding(model)
+    if encoding is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+
+MARKDOWN_SEPARATOR = re.compile(r"^\|(?:-+\|)+$")
+
+
+def _header_rows(rows: List[str], markdown: bool) -> int:
+    """
+    Number of leading rows that make up the table header; colspan/rowspan headers span several.
+    """
+    if markdown:
+        # Every line up to and including the separator written by html_table_to_markdown()
+        for i, row in enumerate(rows):
+            if MARKDOWN_SEPARATOR.match(row.strip()):
+                return i + 1
+        return 1
+    count = 0
+    in_thead = False
+    for row in rows:
+        in_thead = in_thead or "<thead" in row
+        if not (in_thead or ("<th" in row and "<td" not in row)):
+            break
+        count += 1
+        if "</thead>" in row:
+            break
+    return max(count, 1)
+
+
+def _truncate_table(table: str, max_tokens: int, model: Optional[str], markdown: bool) -> Optional[str]:
+    # Keep whole rows only, so the model never sees a half-open row
+    if markdown:
+        rows, closing = [line + "\n" for line in table.split("\n")], ""
+    else:
+        rows, closing = re.split(r"(?<=</tr>)", table)[:-1], "</table>"
+    # The header rows (and the markdown separator) always go together
+    header = _header_rows(rows, markdown)
+    rows = ["".join(rows[:header])] + rows[header:] if rows else rows
+    kept = []
+    used = 0
+    for row in rows:
+        row_tokens = count_tokens(row, model)
+        if used + row_tokens > max_tokens:
+            break
+        kept.append(row)
+        used += row_tokens
+    if not kept:
+        return None
+    return ("".join(kept) + closing).rstrip("\n") + TRUNCATION_MARK
+
+
+def _body(payload: Dict[str, Any], max_table_tokens: int, model: Optional[str], table_format: str) -> Tuple[str, str, bool]:
+    """
+    Return the label, body and whether it was shortened, for one retrieved payload.
+    """
+    if payload.get("content_type") != "table":
+        return "Text", payload.get("text", ""), False
+
+    # Points ingested before compact tables existed only have the HTML
+    markdown = table_format == "markdown" and bool(payload.get("table_markdown"))
+    label, table = ("Table", payload["table_markdown"]) if markdown else ("Table HTML", payload.get("table_html", ""))
+    if count_tokens(table, model) <= max_table_tokens:
+        return label, table, False
+    truncated = _truncate_table(table, max_table_tokens, model, markdown)
+    if truncated is not None:
+        return label, truncated, True
+    # Not even one row fits, the summary written at ingestion stands in for the table
+    return "Table summary", payload.get("summary", ""), True
+
+
+def pack_context(
+    search_results: Sequence[Any],
+    token_budget: int = 3000,
+    max_table_tokens: int = 1000,
+    model: Optional[str] = None,
+    table_format: str = "markdown"
+) -> Tuple[str, Dict[str, int]]:
+    """
+    Fill a token budget with retrieved chunks in rank order.
+
+    Chunks from the same page and section are merged under one header, at
+    the position of the best ranked one. Tables above `max_table_tokens` are
+    cut to whole rows (or replaced by their summary), and a chunk that does
+    not fit is truncated to the remaining budget or skipped, so lower ranked
+    smaller chunks can still get in.
+
+    Args:
+        search_results: Scored points with the ingestion payload, best first
+        token_budget: Maximum tokens of the packed context
+        max_table_tokens: Maximum tokens of a single table
+        model: Model whose tokenizer is used for counting
+        table_format: "markdown" to use the compact tables written at ingestion, or "html"
+
+    Returns:
+        The context string, and stats with the tokens used and the number of
+        included, truncated and skipped chunks
+    """
+    groups: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    for doc in search_results:
+        payload = doc.payload
+        groups.setdefault((payload.get("page_title", ""), payload.get("section_title", "")), []).append(payload)
+
+    parts = []
+    used = 0
+    stats = {"context_tokens": 0, "included": 0, "truncated": 0, "skipped": 0}
+
+    for (page_title, section_title), payloads in groups.items():
+        header = f"Page title: {page_title}\nSection title: {section_title}\n"
+        # The blank lines closing the group are charged with the header
+        header_tokens = count_tokens(header + "\n\n", model)
+        group_parts = []
+
+        for payload in payloads:
+            label, body, shortened = _body(payload, max_table_tokens, model, table_format)
+            # Markdown tables start on their own line so the header row stays aligned
+            part = f"{label}:\n{body}\n" if label == "Table" else f"{label}: {body}\n"
+            part_tokens = count_tokens(part, model)
+            overhead = 0 if group_parts else header_tokens
+            remaining = token_budget - used - overhead
+
+            if part_tokens > remaining and label != "Text" and payload.get("summary"):
+                # The summary is far smaller than the table and may still fit
+                part = f"Table summary: {payload['summary']}\n"
+                part_tokens = count_tokens(part, model)
+                shortened = True
+
+            if part_tokens > remaining:
+                # Cutting an HTML table mid-tag would be worse than leaving it out
+                if label == "Text" and remaining >= MIN_TRUNCATED_TOKENS:
+                    part = truncate_tokens(part, remaining - count_tokens(TRUNCATION_MARK + "\n", model), model) + TRUNCATION_MARK + "\n"
+                    part_tokens = count_tokens(part, model)
+                    shortened = True
+                else:
+                    stats["skipped"] += 1
+                    continue
+
+            group_parts.append(part)
+            used += part_tokens + overhead
+            stats["included"] += 1
+            stats["truncated"] += int(shortened)
+
+        if group_parts:
+            parts.append(header + "".join(group_parts) + "\n\n")
+
+    context = "".join(parts)
+    stats["context_tokens"] = count_tokens(context, model)
+    return context, stats
@@ -0,0 +1,334 @@
+import argparse
+import asyncio
+import os
+import sqlite3
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+import aiohttp
+
+from partitioning import PROJECT_ROOT, RAW_HTML_DIR
+
+MANIFEST = os.path.join(PROJECT_ROOT, "data", "crawl_manifest.db")
+USER_AGENT = "researchbot/1.0"
+# Requests per second and burst size allowed per host, and requests in flight overall
+RATE_PER_HOST = 4.0
+BURST_PER_HOST = 4
+MAX_CONCURRENT = 8
+RETRY_LIMIT = 3
+BACKOFF_BASE = 2            # seconds to wait * attempt number
+# Statuses worth retrying; anything else is recorded as a failure right away
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def read_links(path: str) -> List[str]:
+    links = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            links.append(line)
+    return links
+
+
+def page_file_name(url: str) -> str:
+    """
+    File a page is saved to; the page title used at partitioning comes from it.
+    """
+    return urlparse(url).path.replace("/", "") + ".html"
+
+
+class TokenBucket:
+    """
+    Allow `rate` requests per second on average, with bursts of up to `capacity`.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        # Waiters queue on the lock, so tokens are handed out in arrival order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """
+        Hold back the next requests, e.g. after the server answered 429 with Retry-After.
+        """
+        self._tokens = min(self._tokens, 0) - seconds * self.rate
+
+
+class CrawlManifest:
+    """
+    SQLite record of every fetched page (file, ETag, Last-Modified, status) and of crawl runs.
+
+    A crawl that did not finish is resumed by the next one, which skips the
+    pages already fetched since it started.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: SQLite file holding the manifest
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "url TEXT PRIMARY KEY, file TEXT, etag TEXT, last_modified TEXT, status INTEGER, error TEXT, fetched_at REAL)"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS crawls (id INTEGER PRIMARY KEY, started_at REAL, finished_at REAL)")
+        self._db.commit()
+
+    def start_crawl(self) -> float:
+        """
+        Start a crawl, or resume the last one if it did not finish.
+
+        Returns:
+            Start time of the crawl; pages fetched since then are done
+        """
+        row = self._db.execute("SELECT id, started_at, finished_at FROM crawls ORDER BY id DESC LIMIT 1").fetchone()
+        if row is not None and row[2] is None:
+            return row[1]
+        started_at = time.time()
+        self._db.execute("INSERT INTO crawls (started_at) VALUES (?)", (started_at,))
+        self._db.commit()
+        return started_at
+
+    def finish_crawl(self):
+        self._db.execute("UPDATE crawls SET finished_at = ? WHERE finished_at IS NULL", (time.time(),))
+        self._db.commit()
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        row = self._db.execute(
+            "SELECT file, etag, last_modified, status, fetched_at FROM pages WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("file", "etag", "last_modified", "status", "fetched_at"), row))
+
+    def record(self, url: str, file: str, status: int, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        """
+        Mark a page as fetched; a 304 keeps the validators stored with the 200 before it.
+        """
+        self._db.execute(
+            "INSERT INTO pages (url, file, etag, last_modified, status, error, fetched_at) VALUES (?, ?, ?, ?, ?, NULL, ?) "
+            "ON CONFLICT(url) DO UPDATE SET file = excluded.file, status = excluded.status, error = NULL, "
+            "fetched_at = excluded.fetched_at, "
+            "etag = CASE WHEN excluded.status = 304 THEN pages.etag ELSE excluded.etag END, "
+            "last_modified = CASE WHEN excluded.status = 304 THEN pages.last_modified ELSE excluded.last_modified END",
+            (url, file, etag, last_modified, status, time.time()),
+        )
+        self._db.commit()
+
+    def record_failure(self, url: str, file: str, status: Optional[int], error: str):
+        # fetched_at is left alone, so a resumed crawl tries the page again
+        self._db.execute(
+            "INSERT INTO pages (url, file, status, error) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(url) DO UPDATE SET status = excluded.status, error = excluded.error",
+            (url, file, status, error),
+        )
+        self._db.commit()
+
+
+def _retry_after(response: aiohttp.ClientResponse) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+async def fetch_page(
+    session: aiohttp.ClientSession,
+    url: str,
+    save_dir: str,
+    manifest: CrawlManifest,
+    bucket: TokenBucket
+) -> Optional[int]:
+    """
+    Fetch one page with a conditional GET and save it if it changed.
+
+    Returns:
+        200 when the page was saved, 304 when it was unchanged, None when it failed
+    """
+    file_name = page_file_name(url)
+    path = os.path.join(save_dir, file_name)
+    headers = {}
+    known = manifest.get(url)
+    # Validators only help while the file they describe is still on disk
+    if known is not None and os.path.exists(path):
+        if known["etag"]:
+            headers["If-None-Match"] = known["etag"]
+        if known["last_modified"]:
+            headers["If-Modified-Since"] = known["last_modified"]
+
+    status = None
+    error = None
+    for attempt in range(RETRY_LIMIT):
+        await bucket.acquire()
+        try:
+            async with session.get(url, headers=headers) as response:
+                status = response.status
+                if status == 304:
+                    manifest.record(url, file_name, 304)
+                    return 304
+                if status == 200:
+                    text = await response.text()
+                    # Written next to the target first, so a crash never leaves a truncated page behind
+                    tmp_path = path + ".part"
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        f.write(text)
+                    os.replace(tmp_path, path)
+                    manifest.record(url, file_name, 200, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+                    return 200
+                error = f"HTTP {status}"
+                if status not in RETRY_STATUSES:
+                    break
+                wait_time = _retry_after(response)
+                if wait_time is not None:
+                    bucket.pause(wait_time)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error = f"{type(e).__name__}: {e}"
+        if attempt + 1 < RETRY_LIMIT:
+            await asyncio.sleep(BACKOFF_BASE * (attempt + 1))
+
+    print(f"ERROR: Could not download {url}: {error}")
+    manifest.record_failure(url, file_name, status, error)
+    return None
+
+
+async def crawl_async(
+    urls: List[str],
+    save_dir: str = RAW_HTML_DIR,
+    manifest_path: str = MANIFEST,
+    max_concurrent: int = MAX_CONCURRENT,
+    rate_per_host: float = RATE_PER_HOST,
+    burst_per_host: int = BURST_PER_HOST,
+    timeout: float = 30
+) -> Dict[str, int]:
+    """
+    Download wiki pages concurrently, skipping unchanged ones.
+
+    Every page is requested with the ETag and Last-Modified stored in the
+    manifest, so a refresh crawl mostly gets 304s and rewrites only changed
+    pages. Requests are spread over a token bucket per host. If a crawl
+    stops early, the next call resumes it and skips the pages it already
+    fetched.
+
+    Args:
+        urls: Page URLs
+        save_dir: Directory receiving one HTML file per page
+        manifest_path: SQLite manifest of fetched pages
+        max_concurrent: Requests in flight overall
+        rate_per_host: Average requests per second per host
+        burst_per_host: Requests a host may get at once after being idle
+        timeout: Seconds allowed per request
+
+    Returns:
+        Counts of saved, unchanged, skipped (done before a resume) and failed pages
+    """
+    os.makedirs(save_dir, exist_ok=True)
+    manifest = CrawlManifest(manifest_path)
+    started_at = manifest.start_crawl()
+    urls = list(dict.fromkeys(urls))
+
+    counts = {"saved": 0, "unchanged": 0, "skipped": 0, "failed": 0}
+    pending = []
+    for url in urls:
+        known = manifest.get(url)
+        if known is not None and known["fetched_at"] is not None and known["fetched_at"] >= started_at:
+            counts["skipped"] += 1
+        else:
+            pending.append(url)
+    if counts["skipped"]:
+        print(f"INFO: Resuming the last crawl, {counts['skipped']} of {len(urls)} pages already fetched")
+
+    buckets: Dict[str, TokenBucket] = {}
+    queue: asyncio.Queue = asyncio.Queue()
+    for url in pending:
+        queue.put_nowait(url)
+
+    async def worker(session):
+        while True:
+            try:
+                url = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            host = urlparse(url).netloc
+            if host not in buckets:
+                buckets[host] = TokenBucket(rate_per_host, burst_per_host)
+            result = await fetch_page(session, url, save_dir, manifest, buckets[host])
+            counts[{200: "saved", 304: "unchanged", None: "failed"}[result]] += 1
+            done = sum(counts.values())
+            if done % 100 == 0:
+                print(f"INFO: Crawled {done}/{len(urls)} pages")
+
+    async with aiohttp.ClientSession(
+        headers={"User-Agent": USER_AGENT},
+        timeout=aiohttp.ClientTimeout(total=timeout),
+        connector=aiohttp.TCPConnector(limit=max_concurrent),
+    ) as session:
+        # Workers pull URLs from the queue, so only max_concurrent fetches exist at a time
+        await asyncio.gather(*(worker(session) for _ in range(min(max_concurrent, len(pending)))))
+
+    # Failed pages have no fetched_at in this crawl; they are retried by the next one anyway
+    manifest.finish_crawl()
+    print(
+        f"SUCCESS: Crawled {len(urls)} pages: {counts['saved']} saved, {counts['unchanged']} unchanged, "
+        f"{counts['skipped']} already fetched, {counts['failed']} failed"
+    )
+    return counts
+
+
+def crawl(urls: List[str], **kwargs) -> Dict[str, int]:
+    """
+    Sync wrapper of crawl_async() for scripts.
+    """
+    return asyncio.run(crawl_async(urls, **kwargs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download the wiki pages listed in a file, skipping unchanged ones")
+    parser.add_argument("links", help="File with one URL per line")
+    parser.add_argument("--out", default=RAW_HTML_DIR)
+    parser.add_argument("--manifest", default=MANIFEST)
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENT)
+    parser.add_argument("--rate", type=float, default=RATE_PER_HOST, help="Requests per second per host")
+    parser.add_argument("--burst", type=int, default=BURST_PER_HOST)
+    args = parser.parse_args()
+
+    crawl(
+        read_links(args.links),
+        save_dir=args.out,
+        manifest_path=args.manifest,
+        max_concurrent=args.concurrency,
+        rate_per_host=args.rate,
+        burst_per_host=args.burst,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 import json
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Sequence
 
 
 def load_json(path: str) -> List[Dict[str, Any]]:
@@ -12,15 +12,89 @@ def load_json(path: str) -> List[Dict[str, Any]]:
         return json.load(f)
 
 
-def load_data_with_content_types(
-    texts_path: str = None,
-    tables_path: str = None
-) -> tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+def iter_json(path: str, chunk_size: int = 1 << 16) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the elements of a top-level JSON array one at a time.
+
+    Only the element being decoded and one read buffer are held in memory,
+    so memory stays flat regardless of file size.
+
+    Args:
+        path: Path to a JSON file containing an array
+        chunk_size: Number of characters read per call
+
+    Yields:
+        Decoded array elements
+    """
+    if not os.path.exists(path):
+        print(f"WARNING: File not found: {path}")
+        return
+
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding="utf-8") as f:
+        buffer = ""
+        pos = 0
+        started = False
+        eof = False
+
+        while True:
+            # Skip whitespace and separators between elements
+            while pos < len(buffer) and (buffer[pos].isspace() or (started and buffer[pos] == ",")):
+                pos += 1
+
+            if pos < len(buffer):
+                if not started:
+                    if buffer[pos] != "[":
+                        raise ValueError(f"Expected a JSON array in {path}")
+                    started = True
+                    pos += 1
+                    continue
+                if buffer[pos] == "]":
+                    return
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                else:
+                    # An element is only complete once the "," or "]" after it is in the buffer:
+                    # a number cut by the read (123|456, 2.5|e10) also decodes, as a shorter one
+                    after = end
+                    while after < len(buffer) and buffer[after].isspace():
+                        after += 1
+                    if after < len(buffer) and buffer[after] in ",]":
+                        yield item
+                        pos = end
+                        continue
+                    if eof:
+                        raise ValueError(f"Expected ',' or ']' after an element of {path}")
+            elif eof:
+                if started:
+                    raise ValueError(f"Unterminated JSON array in {path}")
+                return
+
+            # Need more input: drop what was consumed and read the next chunk.
+            # Reads grow with the pending buffer so a very large element is decoded in amortized linear time.
+            data = f.read(max(chunk_size, len(buffer) - pos))
+            buffer = buffer[pos:] + data
+            pos = 0
+            eof = not data
+
+
+def _default_paths(texts_path: str = None, tables_path: str = None) -> tuple[str, str]:
     # Set default paths relative to the project root
     if texts_path is None:
         texts_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "summarized_texts.json")
     if tables_path is None:
         tables_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "summarized_tables.json")
+    return texts_path, tables_path
+
+
+def load_data_with_content_types(
+    texts_path: str = None,
+    tables_path: str = None
+) -> tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    texts_path, tables_path = _default_paths(texts_path, tables_path)
     # Load the data
     texts = load_json(texts_path)
     tables = load_json(tables_path)
@@ -40,10 +114,46 @@ def load_data_with_content_types(
 def data_ingestion(
     texts_path: str = None,
     tables_path: str = None
-) -> tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+) -> tuple[Sequence[Dict[str, Any]], Sequence[Dict[str, Any]]]:
+    """
+    Return the text and table chunks, each tagged with its content type.
+
+    When the memory-mapped knowledge-base file written by
+    knowledge_base.convert_json_to_kb() is up to date, the chunks are lazy
+    sequences over it, decoded only when accessed; otherwise the JSON files
+    are loaded into lists.
+    """
+    if texts_path is None and tables_path is None:
+        from knowledge_base import shared_knowledge_base
+        # Mapped once per process and reused by later calls
+        kb = shared_knowledge_base()
+        if kb is not None:
+            texts, tables = kb.filter("text"), kb.filter("table")
+            print(f"SUCCESS: Opened {len(texts)} text entries and {len(tables)} table entries from {kb.path}")
+            return texts, tables
     return load_data_with_content_types(texts_path, tables_path)
 
 
+def iter_data_with_content_types(
+    texts_path: str = None,
+    tables_path: str = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Stream text entries followed by table entries, each tagged with its content type.
+
+    Streaming counterpart of load_data_with_content_types().
+    """
+    texts_path, tables_path = _default_paths(texts_path, tables_path)
+
+    for text in iter_json(texts_path):
+        text["content_type"] = "text"
+        yield text
+
+    for table in iter_json(tables_path):
+        table["content_type"] = "table"
+        yield table
+
+
 if __name__ == "__main__":
     # Example usage
     texts, tables = data_ingestion()
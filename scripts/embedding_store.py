@@ -0,0 +1,193 @@
+import hashlib
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def text_hash(text: str) -> str:
+    """
+    Hash the exact text that is embedded, so identical content is only embedded once.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """
+    Append-only on-disk store of document embeddings for one pair of models.
+
+    Dense vectors live in a flat float32 file that is memory-mapped as a
+    (rows, dim) array. Sparse vectors are kept CSR-style: one int64 end
+    offset per row, plus flat indices and values files. A text index maps
+    content hashes to rows. Each (dense model, sparse model) pair gets its
+    own directory, so changing a model handle only misses for that pair.
+
+    Layout of `<root>/<models>/`:
+        dense.f32        rows * dim float32
+        sparse_end.i64   one end offset per row into the two files below
+        sparse_idx.i64   concatenated sparse indices
+        sparse_val.f32   concatenated sparse values
+        index.tsv        "<content hash>\t<row>" per line, written last
+    """
+
+    def __init__(
+        self,
+        root: str,
+        vector_model_handle: str,
+        sparse_model_handle: str,
+        embedding_dimensionality: int = 512
+    ):
+        """
+        Args:
+            root: Directory holding the stores of every model pair
+            vector_model_handle: fastembed model handle for dense vectors
+            sparse_model_handle: fastembed model handle for sparse vectors
+            embedding_dimensionality: Size of the dense vectors
+        """
+        slug = re.sub(r"[^A-Za-z0-9._-]+", "_", f"{vector_model_handle}__{sparse_model_handle}")
+        self.path = os.path.join(root, slug)
+        self.dim = embedding_dimensionality
+        os.makedirs(self.path, exist_ok=True)
+
+        self._dense_path = os.path.join(self.path, "dense.f32")
+        self._end_path = os.path.join(self.path, "sparse_end.i64")
+        self._idx_path = os.path.join(self.path, "sparse_idx.i64")
+        self._val_path = os.path.join(self.path, "sparse_val.f32")
+        self._index_path = os.path.join(self.path, "index.tsv")
+
+        self._lock = threading.Lock()
+        self._rows: Dict[str, int] = {}
+        self._maps = None
+        self._load_index()
+
+    def _load_index(self):
+        if os.path.exists(self._index_path):
+            with open(self._index_path, "rb+") as f:
+                content = f.read()
+                # Drop a torn last line from an interrupted run
+                complete = content[:content.rfind(b"\n") + 1]
+                if len(complete) != len(content):
+                    f.truncate(len(complete))
+            for line in complete.decode("utf-8").splitlines():
+                key, row = line.split("\t")
+                self._rows[key] = int(row)
+
+        # Rows past the last indexed one belong to an interrupted write and are dropped
+        count = max(self._rows.values()) + 1 if self._rows else 0
+        self._truncate(count)
+
+    def _truncate(self, count: int):
+        sparse_len = self._sparse_len(count)
+        for path, size in (
+            (self._dense_path, count * self.dim * 4),
+            (self._end_path, count * 8),
+            (self._idx_path, sparse_len * 8),
+            (self._val_path, sparse_len * 4),
+        ):
+            with open(path, "ab") as f:
+                f.truncate(size)
+
+    def _sparse_len(self, count: int) -> int:
+        # The end offset of the last row is the length of the sparse files
+        if count == 0:
+            return 0
+        return int(np.fromfile(self._end_path, dtype=np.int64, count=1, offset=(count - 1) * 8)[0])
+
+    def _open_maps(self):
+        # Memory maps are reopened lazily after every append
+        if self._maps is None:
+            count = len(self._rows)
+            if count == 0:
+                self._maps = (np.zeros((0, self.dim), dtype=np.float32), np.zeros(0, dtype=np.int64), None, None)
+            else:
+                ends = np.memmap(self._end_path, dtype=np.int64, mode="r", shape=(count,))
+                sparse_len = int(ends[-1])
+                self._maps = (
+                    np.memmap(self._dense_path, dtype=np.float32, mode="r", shape=(count, self.dim)),
+                    ends,
+                    np.memmap(self._idx_path, dtype=np.int64, mode="r", shape=(sparse_len,)) if sparse_len else np.zeros(0, dtype=np.int64),
+                    np.memmap(self._val_path, dtype=np.float32, mode="r", shape=(sparse_len,)) if sparse_len else np.zeros(0, dtype=np.float32),
+                )
+        return self._maps
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._rows
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[Tuple[np.ndarray, Tuple[np.ndarray, np.ndarray]]]]:
+        """
+        Look up stored vectors by content hash.
+
+        Args:
+            keys: Content hashes
+
+        Returns:
+            For each key, (dense vector, (sparse indices, sparse values)) or None if not stored
+        """
+        with self._lock:
+            dense, ends, indices, values = self._open_maps()
+            results = []
+            for key in keys:
+                row = self._rows.get(key)
+                if row is None:
+                    results.append(None)
+                    continue
+                start = int(ends[row - 1]) if row else 0
+                end = int(ends[row])
+                results.append((np.array(dense[row]), (np.array(indices[start:end]), np.array(values[start:end]))))
+            return results
+
+    def put_many(
+        self,
+        keys: Sequence[str],
+        dense: np.ndarray,
+        sparse: Sequence[Tuple[np.ndarray, np.ndarray]]
+    ):
+        """
+        Append vectors for content hashes that are not stored yet.
+
+        Args:
+            keys: Content hashes
+            dense: Dense vectors, one row per key
+            sparse: (indices, values) arrays per key
+        """
+        with self._lock:
+            new = []
+            seen = set()
+            for i, key in enumerate(keys):
+                if key not in self._rows and key not in seen:
+                    seen.add(key)
+                    new.append((key, i))
+            if not new:
+                return
+
+            first_row = len(self._rows)
+            sparse_len = self._sparse_len(first_row)
+            ends = []
+            for _, i in new:
+                sparse_len += len(sparse[i][0])
+                ends.append(sparse_len)
+
+            with open(self._dense_path, "ab") as f:
+                f.write(np.asarray([dense[i] for _, i in new], dtype=np.float32).reshape(len(new), self.dim).tobytes())
+            with open(self._idx_path, "ab") as f:
+                for _, i in new:
+                    f.write(np.asarray(sparse[i][0], dtype=np.int64).tobytes())
+            with open(self._val_path, "ab") as f:
+                for _, i in new:
+                    f.write(np.asarray(sparse[i][1], dtype=np.float32).tobytes())
+            with open(self._end_path, "ab") as f:
+                f.write(np.asarray(ends, dtype=np.int64).tobytes())
+
+            # The index is written last, so an interrupted append is invisible on the next open
+            with open(self._index_path, "a", encoding="utf-8") as f:
+                for row, (key, _) in enumerate(new, start=first_row):
+                    f.write(f"{key}\t{row}\n")
+
+            for row, (key, _) in enumerate(new, start=first_row):
+                self._rows[key] = row
+            self._maps = None
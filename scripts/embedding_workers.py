@@ -0,0 +1,112 @@
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+# Models loaded once per worker process by init_embedding_worker()
+_dense_model = None
+_sparse_model = None
+
+
+def init_embedding_worker(vector_model_handle: str, sparse_model_handle: str, threads: Optional[int] = None):
+    """
+    Load the dense and sparse document models in the current process.
+
+    Used as the ProcessPoolExecutor initializer, and directly when embedding in-process.
+
+    Args:
+        vector_model_handle: fastembed model handle for dense vectors
+        sparse_model_handle: fastembed model handle for sparse vectors
+        threads: ONNX runtime threads per model, None lets onnxruntime decide
+    """
+    global _dense_model, _sparse_model
+    from fastembed import SparseTextEmbedding, TextEmbedding
+    _dense_model = TextEmbedding(vector_model_handle, threads=threads)
+    _sparse_model = SparseTextEmbedding(sparse_model_handle, threads=threads)
+
+
+def embed_documents(texts: List[str]) -> Tuple[np.ndarray, List[Tuple[np.ndarray, np.ndarray]]]:
+    """
+    Embed a batch of documents with the models loaded in this process.
+
+    Args:
+        texts: Documents to embed
+
+    Returns:
+        Dense vectors as a float32 matrix, and (indices, values) arrays per sparse vector
+    """
+    dense = np.asarray(list(_dense_model.embed(texts, batch_size=len(texts))), dtype=np.float32)
+    sparse = [
+        (embedding.indices.astype(np.int64), embedding.values.astype(np.float32))
+        for embedding in _sparse_model.embed(texts, batch_size=len(texts))
+    ]
+    return dense, sparse
+
+
+class EmbeddingPool:
+    """
+    Embed document batches on a pool of worker processes, each holding its own copy of the models.
+
+    With `workers=0` batches are embedded in the calling process, which is
+    handy for small corpora and debugging.
+    """
+
+    def __init__(
+        self,
+        vector_model_handle: str,
+        sparse_model_handle: str,
+        workers: Optional[int] = None
+    ):
+        """
+        Args:
+            vector_model_handle: fastembed model handle for dense vectors
+            sparse_model_handle: fastembed model handle for sparse vectors
+            workers: Number of worker processes, defaults to the number of CPUs
+        """
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self._executor = None
+
+        if self.workers > 0:
+            # Split the cores between workers instead of letting every worker oversubscribe them
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=init_embedding_worker,
+                initargs=(vector_model_handle, sparse_model_handle, threads),
+            )
+        self._model_handles = (vector_model_handle, sparse_model_handle)
+
+    def submit(self, texts: List[str]) -> Future:
+        """
+        Schedule a batch for embedding.
+
+        Args:
+            texts: Documents to embed
+
+        Returns:
+            Future resolving to the result of embed_documents()
+        """
+        if self._executor is not None:
+            return self._executor.submit(embed_documents, texts)
+
+        future = Future()
+        try:
+            # Models are loaded on first use, so a run served entirely from the embedding store never loads them
+            if _dense_model is None:
+                init_embedding_worker(*self._model_handles)
+            future.set_result(embed_documents(texts))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
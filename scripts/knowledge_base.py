@@ -0,0 +1,223 @@
+import argparse
+import json
+from array import array
+import mmap
+import os
+import random
+import struct
+import threading
+from collections.abc import Sequence
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from data_ingest import _default_paths, iter_data_with_content_types
+from partitioning import PROJECT_ROOT
+
+KB_PATH = os.path.join(PROJECT_ROOT, "data", "knowledge_base.kb")
+
+MAGIC = b"SDKB"
+VERSION = 1
+# magic, version, record count, byte offset of the index
+HEADER = struct.Struct("<4sIQQ")
+CONTENT_TYPES = ("text", "table")
+
+# Path -> (mtime, KnowledgeBase) of the files opened through shared_knowledge_base()
+_shared: Dict[str, Any] = {}
+_shared_lock = threading.Lock()
+
+
+def convert_json_to_kb(texts_path: Optional[str] = None, tables_path: Optional[str] = None, kb_path: str = KB_PATH) -> int:
+    """
+    Write the text and table chunks into one memory-mappable knowledge-base file.
+
+    Layout (little endian):
+        header   magic "SDKB", u32 version, u64 record count, u64 index offset
+        records  compact UTF-8 JSON of every chunk, back to back
+        index    u64 start offset of every record plus the end of the last one,
+                 then one u8 content type per record (0 text, 1 table)
+
+    The JSON files are streamed, so only 9 bytes of index per record are
+    held in memory, and the file is written next to `kb_path` and renamed
+    into place.
+
+    Args:
+        texts_path: Text chunks, defaults to data/summarized_texts.json
+        tables_path: Table chunks, defaults to data/summarized_tables.json
+        kb_path: Output file
+
+    Returns:
+        Number of records written
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(kb_path)), exist_ok=True)
+    tmp_path = kb_path + ".part"
+    offsets = array("Q")
+    types = bytearray()
+
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, 0))
+        for chunk in iter_data_with_content_types(texts_path, tables_path):
+            offsets.append(f.tell())
+            types.append(CONTENT_TYPES.index(chunk["content_type"]))
+            f.write(json.dumps(chunk, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        offsets.append(f.tell())
+
+        # The offsets are read in place as u64, so they start on an 8 byte boundary
+        f.write(b"\0" * (-f.tell() % 8))
+        index_offset = f.tell()
+        f.write(np.frombuffer(offsets, dtype=np.uint64).astype("<u8").tobytes())
+        f.write(bytes(types))
+
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, len(types), index_offset))
+
+    os.replace(tmp_path, kb_path)
+    print(f"SUCCESS: Wrote {len(types)} records to {kb_path} ({os.path.getsize(kb_path) / 2**20:.1f} MB)")
+    return len(types)
+
+
+class KnowledgeBase(Sequence):
+    """
+    Read-only, memory-mapped view of a file written by convert_json_to_kb().
+
+    Opening only maps the file; a record is decoded when it is accessed, so
+    load time and memory don't grow with the corpus. Behaves like a list of
+    chunk dicts (len, indexing, iteration, random.sample).
+    """
+
+    def __init__(self, path: str = KB_PATH):
+        """
+        Args:
+            path: Knowledge-base file
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, index_offset = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a knowledge-base file")
+        if version != VERSION:
+            raise ValueError(f"{path} has format version {version}, expected {VERSION}; convert the JSON again")
+        self._offsets = np.frombuffer(self._map, dtype="<u8", count=count + 1, offset=index_offset)
+        self._types = np.frombuffer(self._map, dtype=np.uint8, count=count, offset=index_offset + 8 * (count + 1))
+
+    def __len__(self) -> int:
+        return len(self._types)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("knowledge base index out of range")
+        return json.loads(self._map[int(self._offsets[i]):int(self._offsets[i + 1])])
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def indices(self, content_type: Optional[str] = None) -> np.ndarray:
+        """
+        Record numbers of one content type, from the type column alone.
+        """
+        if content_type is None:
+            return np.arange(len(self))
+        return np.flatnonzero(self._types == CONTENT_TYPES.index(content_type))
+
+    def filter(self, content_type: str) -> "KnowledgeBaseView":
+        return KnowledgeBaseView(self, self.indices(content_type))
+
+    def sample(self, k: int, seed: Optional[int] = None, content_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Decode `k` random records, optionally of one content type.
+        """
+        view = self.filter(content_type) if content_type else self
+        return random.Random(seed).sample(view, k)
+
+    def close(self):
+        # The index arrays point into the map, so they go first
+        self._offsets = self._types = None
+        self._map.close()
+
+
+class KnowledgeBaseView(Sequence):
+    """
+    Lazy list of selected records of a KnowledgeBase.
+    """
+
+    def __init__(self, kb: KnowledgeBase, indices: np.ndarray):
+        self.kb = kb
+        self._indices = indices
+
+    def __len__(self) -> int:
+        return len(self._indices)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self.kb[int(self._indices[i])]
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in self._indices:
+            yield self.kb[int(i)]
+
+
+def _is_stale(kb_path: str, texts_path: Optional[str] = None, tables_path: Optional[str] = None) -> bool:
+    kb_mtime = os.path.getmtime(kb_path)
+    return any(os.path.exists(path) and os.path.getmtime(path) > kb_mtime for path in _default_paths(texts_path, tables_path))
+
+
+def open_knowledge_base(
+    kb_path: str = KB_PATH,
+    texts_path: Optional[str] = None,
+    tables_path: Optional[str] = None
+) -> Optional[KnowledgeBase]:
+    """
+    Open the knowledge-base file if it exists and is not older than the JSON files it was converted from.
+    """
+    if not os.path.exists(kb_path):
+        return None
+    if _is_stale(kb_path, texts_path, tables_path):
+        print(f"WARNING: {kb_path} is older than the JSON chunks, reading the JSON. Rebuild it with python scripts/knowledge_base.py")
+        return None
+    return KnowledgeBase(kb_path)
+
+
+def shared_knowledge_base(
+    kb_path: str = KB_PATH,
+    texts_path: Optional[str] = None,
+    tables_path: Optional[str] = None
+) -> Optional[KnowledgeBase]:
+    """
+    open_knowledge_base(), mapping each file once per process.
+
+    The same KnowledgeBase is returned until the file is rewritten or goes
+    stale. The old one is only dropped from the cache, not closed: views
+    handed out earlier keep reading it (a replaced file stays readable
+    through its mapping) until they are garbage collected.
+    """
+    with _shared_lock:
+        mtime = os.path.getmtime(kb_path) if os.path.exists(kb_path) else None
+        cached = _shared.get(kb_path)
+        if cached is not None and cached[0] == mtime and not _is_stale(kb_path, texts_path, tables_path):
+            return cached[1]
+        _shared.pop(kb_path, None)
+        kb = open_knowledge_base(kb_path, texts_path, tables_path)
+        if kb is not None:
+            _shared[kb_path] = (mtime, kb)
+        return kb
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the JSON chunks into a memory-mappable knowledge-base file")
+    parser.add_argument("--texts", default=None)
+    parser.add_argument("--tables", default=None)
+    parser.add_argument("--out", default=KB_PATH)
+    args = parser.parse_args()
+
+    convert_json_to_kb(args.texts, args.tables, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,114 @@
-from RAG_pipeline import rag, llm
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-def llm_eval(models, query):
+from RAG_pipeline import build_prompt, llm, rrf_search
+
+
+def _answer(prompt, model):
+    stats = {}
+    start = time.perf_counter()
+    try:
+        answer = llm(prompt, model=model, stats=stats)
+        error = None
+    except Exception as e:
+        answer, error = None, str(e)
+    return {
+        "model": model,
+        "answer": answer,
+        "error": error,
+        "latency": time.perf_counter() - start,
+        "prompt_tokens": stats.get("prompt_tokens"),
+        "completion_tokens": stats.get("completion_tokens"),
+    }
+
+
+def iter_model_answers(models, query):
     """
-    Simple LLM evaluation function that compares answers from different models.
-    
+    Answer a question with several models at once, yielding each result as soon as it is ready.
+
+    Retrieval and prompt building run once and every model gets the same
+    prompt, so the comparison only reflects the models. A failing model
+    yields its error instead of stopping the others.
+
     Args:
         models: List of model names to test
         query: Question to ask all models
-    
+
+    Yields:
+        Dictionaries with the model, its answer (or error), latency in seconds
+        and the prompt and completion tokens reported by the API
+    """
+    models = list(dict.fromkeys(models))
+    search_results = rrf_search(query=query)
+    # All models offered in the app share the same tokenizer, so the packed context fits each of them
+    prompt = build_prompt(query, search_results)
+
+    with ThreadPoolExecutor(max_workers=max(len(models), 1)) as pool:
+        futures = [pool.submit(_answer, prompt, model) for model in models]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def judge(query, results, judge_model='gpt-5-mini'):
+    """
+    Ask a judge model to compare the answers of iter_model_answers().
+
+    Args:
+        query: Question the models answered
+        results: Results of iter_model_answers(); failed models are left out
+        judge_model: Model used as the judge
+
     Returns:
-        Dictionary with model answers and judge's evaluation
-    """
-    # Get answers from all models
-    answers = {}
-    for model in models:
-        answers[model] = rag(query, model=model)
-    
-    # Create judge prompt
+        The judge's evaluation
+    """
     judge_prompt = f"""
-    You are an expert judge evaluating AI model responses. 
-    
+    You are an expert judge evaluating AI model responses.
+
     Question: {query}
-    
+
     Model Answers:
     """
-    
-    for model, answer in answers.items():
-        judge_prompt += f"\n{model}: {answer}\n"
-    
+
+    for result in results:
+        if result["error"] is None:
+            judge_prompt += f"\n{result['model']}: {result['answer']}\n"
+
     judge_prompt += """
-    
+
     Please evaluate these answers and provide:
     1. Which answer is best and why
     2. Brief scores (1-10) for each model
     3. Any notable differences
-    
+
     Keep your evaluation concise and objective.
     """
-    
-    # Get judge's evaluation
-    evaluation = llm(judge_prompt)
-    
+
+    return llm(judge_prompt, model=judge_model)
+
+
+def llm_eval(models, query, judge_model='gpt-5-mini'):
+    """
+    Simple LLM evaluation function that compares answers from different models.
+
+    Args:
+        models: List of model names to test
+        query: Question to ask all models
+        judge_model: Model used as the judge
+
+    Returns:
+        Dictionary with model answers, their latency and token usage, and judge's evaluation
+    """
+    results = list(iter_model_answers(models, query))
+    # The judge sees the answers in the order the models were given, not the order they finished in
+    order = {model: i for i, model in enumerate(models)}
+    results.sort(key=lambda result: order[result["model"]])
+
     return {
         "query": query,
-        "answers": answers,
-        "evaluation": evaluation
+        "answers": {result["model"]: result["answer"] if result["error"] is None else f"Error: {result['error']}" for result in results},
+        "metrics": {
+            result["model"]: {key: result[key] for key in ("latency", "prompt_tokens", "completion_tokens")}
+            for result in results
+        },
+        "evaluation": judge(query, results, judge_model),
     }
@@ -0,0 +1,45 @@
+import asyncio
+import threading
+from typing import Optional
+
+from openai import RateLimitError, APIConnectionError, APITimeoutError, InternalServerError
+
+# Transient failures; anything else (bad key, unknown model, bad request) is raised right away
+RETRY_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+
+def retry_after(error) -> Optional[float]:
+    # Honour the server's Retry-After header when a rate limit response carries one
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def run_async(coro):
+    """
+    Run a batch job coroutine from sync code, e.g. question generation or table summaries.
+    """
+    # asyncio.run() refuses to start inside a running loop (e.g. Jupyter), so fall back to a thread there
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    result = {}
+
+    def target():
+        try:
+            result["value"] = asyncio.run(coro)
+        except BaseException as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
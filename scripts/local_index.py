@@ -0,0 +1,444 @@
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from qdrant_client import models
+from qdrant_client.http.models import QueryResponse
+
+
+# Same constant as Qdrant's RRF, so both backends rank identically
+RRF_K = 2
+
+
+class LocalHybridIndex:
+    """
+    In-process replacement for the subset of QdrantClient used by the search functions.
+
+    Holds a single collection with a "jina-small" dense vector and a "bm25"
+    sparse vector per point. Dense search is NumPy brute force over
+    normalized vectors (cosine), sparse search uses an inverted index with
+    the same IDF formula as Qdrant's `Modifier.IDF`. Prefetch, RRF fusion,
+    multi-stage rescoring and keyword match filters are evaluated
+    in-process, and results are `ScoredPoint`s, so
+    `rrf_search(query, client=index)` works unchanged.
+
+    `collection_name` arguments are accepted for signature compatibility and
+    ignored.
+    """
+
+    def __init__(
+        self,
+        embedding_dimensionality: int = 512,
+        dense_name: str = "jina-small",
+        sparse_name: str = "bm25"
+    ):
+        """
+        Args:
+            embedding_dimensionality: Size of the dense vectors
+            dense_name: Name of the dense vector, as used in queries
+            sparse_name: Name of the sparse vector, as used in queries
+        """
+        self.dim = embedding_dimensionality
+        self.dense_name = dense_name
+        self.sparse_name = sparse_name
+
+        self._ids: List[Any] = []
+        self._row_of: Dict[str, int] = {}
+        self._payloads: List[Dict[str, Any]] = []
+        self._alive: List[bool] = []
+        # Memory-mapped vectors of the points read by load(); _dense_rows only holds points upserted since
+        self._dense_base: Optional[np.ndarray] = None
+        self._dense_rows: List[np.ndarray] = []
+        self._sparse_rows: List[Tuple[np.ndarray, np.ndarray]] = []
+
+        self._lock = threading.Lock()
+        self._dirty = True
+        # Payload key -> value -> rows, built on first use by a filter
+        self._field_index: Dict[str, Dict[Any, np.ndarray]] = {}
+
+    # ---- building ----
+
+    def upsert(self, collection_name: Optional[str] = None, points: Sequence[models.PointStruct] = (), **kwargs):
+        """
+        Insert or replace points carrying precomputed dense and sparse vectors.
+        """
+        with self._lock:
+            for point in points:
+                dense = np.asarray(point.vector[self.dense_name], dtype=np.float32)
+                norm = np.linalg.norm(dense)
+                sparse = point.vector[self.sparse_name]
+                if isinstance(sparse, dict):
+                    sparse = models.SparseVector(**sparse)
+
+                old_row = self._row_of.get(str(point.id))
+                if old_row is not None:
+                    self._alive[old_row] = False
+
+                self._row_of[str(point.id)] = len(self._ids)
+                self._ids.append(point.id)
+                self._payloads.append(point.payload or {})
+                self._alive.append(True)
+                self._dense_rows.append(dense / norm if norm else dense)
+                self._sparse_rows.append((
+                    np.asarray(sparse.indices, dtype=np.int64),
+                    np.asarray(sparse.values, dtype=np.float32),
+                ))
+            self._dirty = True
+
+    def count(self, collection_name: Optional[str] = None, **kwargs) -> models.CountResult:
+        return models.CountResult(count=int(sum(self._alive)))
+
+    def _finalize(self):
+        # Rebuild the dense matrix and the inverted index after writes
+        with self._lock:
+            if not self._dirty:
+                return
+            n = len(self._ids)
+            parts = [self._dense_base] if self._dense_base is not None else []
+            if self._dense_rows:
+                parts.append(np.vstack(self._dense_rows))
+            if len(parts) == 1:
+                # A loaded index that was not written to keeps searching the mapped file
+                self._dense = parts[0]
+            else:
+                self._dense = np.vstack(parts) if parts else np.zeros((0, self.dim), dtype=np.float32)
+            self._alive_mask = np.asarray(self._alive, dtype=bool)
+
+            lengths = np.asarray([len(indices) for indices, _ in self._sparse_rows], dtype=np.int64)
+            indices = np.concatenate([i for i, _ in self._sparse_rows]) if n else np.zeros(0, dtype=np.int64)
+            values = np.concatenate([v for _, v in self._sparse_rows]) if n else np.zeros(0, dtype=np.float32)
+            docs = np.repeat(np.arange(n), lengths)
+
+            # Only live points take part in the IDF statistics, as in Qdrant
+            live = self._alive_mask[docs]
+            indices, values, docs = indices[live], values[live], docs[live]
+
+            order = np.argsort(indices, kind="stable")
+            self._posting_docs = docs[order]
+            self._posting_values = values[order]
+            self._terms, self._term_starts, term_counts = np.unique(
+                indices[order], return_index=True, return_counts=True
+            )
+            self._term_ends = self._term_starts + term_counts
+            num_docs = int(self._alive_mask.sum())
+            self._idf = np.log((num_docs - term_counts + 0.5) / (term_counts + 0.5) + 1)
+            self._field_index = {}
+            self._dirty = False
+
+    # ---- searching ----
+
+    def _dense_scores(self, vector) -> Tuple[np.ndarray, np.ndarray]:
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        return self._dense @ query, self._alive_mask.copy()
+
+    def _sparse_scores(self, vector: models.SparseVector) -> Tuple[np.ndarray, np.ndarray]:
+        scores = np.zeros(len(self._ids), dtype=np.float32)
+        matched = np.zeros(len(self._ids), dtype=bool)
+        for term, weight in zip(vector.indices, vector.values):
+            pos = np.searchsorted(self._terms, term)
+            if pos >= len(self._terms) or self._terms[pos] != term:
+                continue
+            start, end = self._term_starts[pos], self._term_ends[pos]
+            docs = self._posting_docs[start:end]
+            # Each document appears once per term, so plain fancy-index addition is safe
+            scores[docs] += self._idf[pos] * weight * self._posting_values[start:end]
+            matched[docs] = True
+        return scores, matched
+
+    def _score(self, query, using: Optional[str]) -> Tuple[np.ndarray, np.ndarray]:
+        if isinstance(query, dict):
+            query = models.SparseVector(**query)
+        if isinstance(query, models.SparseVector):
+            if using not in (None, self.sparse_name):
+                raise ValueError(f"Sparse query used with vector '{using}'")
+            return self._sparse_scores(query)
+        if using not in (None, self.dense_name):
+            raise ValueError(f"Dense query used with vector '{using}'")
+        return self._dense_scores(query)
+
+    def _field_rows(self, key: str) -> Dict[Any, np.ndarray]:
+        index = self._field_index.get(key)
+        if index is None:
+            groups: Dict[Any, List[int]] = {}
+            for row, payload in enumerate(self._payloads):
+                value = (payload or {}).get(key)
+                for item in value if isinstance(value, list) else [value]:
+                    groups.setdefault(item, []).append(row)
+            index = {value: np.asarray(rows, dtype=np.int64) for value, rows in groups.items()}
+            self._field_index[key] = index
+        return index
+
+    def _condition_mask(self, condition) -> np.ndarray:
+        if isinstance(condition, models.Filter):
+            return self._filter_mask(condition)
+        if not isinstance(condition, models.FieldCondition) or condition.match is None:
+            raise ValueError(f"Unsupported filter condition: {condition!r}")
+
+        match = condition.match
+        if isinstance(match, models.MatchValue):
+            values = [match.value]
+        elif isinstance(match, models.MatchAny):
+            values = match.any
+        else:
+            raise ValueError(f"Unsupported match: {match!r}")
+
+        mask = np.zeros(len(self._ids), dtype=bool)
+        index = self._field_rows(condition.key)
+        for value in values:
+            rows = index.get(value)
+            if rows is not None:
+                mask[rows] = True
+        return mask
+
+    def _filter_mask(self, query_filter: Optional[models.Filter]) -> np.ndarray:
+        """
+        Evaluate must / should / must_not keyword match conditions, like a Qdrant payload filter.
+        """
+        mask = np.ones(len(self._ids), dtype=bool)
+        if query_filter is None:
+            return mask
+
+        def conditions(value):
+            if value is None:
+                return []
+            return value if isinstance(value, list) else [value]
+
+        for condition in conditions(query_filter.must):
+            mask &= self._condition_mask(condition)
+        should = conditions(query_filter.should)
+        if should:
+            mask &= np.logical_or.reduce([self._condition_mask(condition) for condition in should])
+        for condition in conditions(query_filter.must_not):
+            mask &= ~self._condition_mask(condition)
+        return mask
+
+    @staticmethod
+    def _top(scores: np.ndarray, mask: np.ndarray, limit: int) -> List[Tuple[int, float]]:
+        rows = np.nonzero(mask)[0]
+        if len(rows) > limit:
+            rows = rows[np.argpartition(-scores[rows], limit - 1)[:limit]]
+        rows = rows[np.argsort(-scores[rows], kind="stable")]
+        return [(int(row), float(scores[row])) for row in rows]
+
+    def _run(self, query, using, prefetch, limit, query_filter=None) -> List[Tuple[int, float]]:
+        if prefetch is None:
+            prefetch = []
+        elif not isinstance(prefetch, (list, tuple)):
+            prefetch = [prefetch]
+
+        if not prefetch:
+            if query is None:
+                raise ValueError("query_points needs a query or a prefetch")
+            scores, mask = self._score(query, using)
+            if query_filter is not None:
+                mask &= self._filter_mask(query_filter)
+            return self._top(scores, mask, limit)
+
+        stages = [self._run(p.query, p.using, p.prefetch, p.limit if p.limit is not None else 10, p.filter) for p in prefetch]
+        if query_filter is not None:
+            allowed = self._filter_mask(query_filter)
+            stages = [[(row, score) for row, score in stage if allowed[row]] for stage in stages]
+
+        if isinstance(query, models.FusionQuery):
+            if query.fusion != models.Fusion.RRF:
+                raise ValueError(f"Unsupported fusion: {query.fusion}")
+            fused: Dict[int, float] = {}
+            for stage in stages:
+                for rank, (row, _) in enumerate(stage):
+                    fused[row] = fused.get(row, 0.0) + 1.0 / (rank + RRF_K)
+            ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)
+            return ranked[:limit]
+
+        if query is None:
+            return [hit for stage in stages for hit in stage][:limit]
+
+        # Multi-stage: rescore only the prefetched candidates
+        candidates = np.zeros(len(self._ids), dtype=bool)
+        for stage in stages:
+            candidates[[row for row, _ in stage]] = True
+        scores, mask = self._score(query, using)
+        return self._top(scores, mask & candidates, limit)
+
+    def query_points(
+        self,
+        collection_name: Optional[str] = None,
+        query=None,
+        using: Optional[str] = None,
+        prefetch=None,
+        limit: int = 10,
+        with_payload: bool = True,
+        query_filter: Optional[models.Filter] = None,
+        **kwargs
+    ) -> QueryResponse:
+        """
+        Evaluate a Qdrant-style query (dense, sparse, prefetch, RRF fusion) in-process.
+
+        Returns:
+            QueryResponse whose points are ScoredPoint objects
+        """
+        self._finalize()
+        hits = self._run(query, using, prefetch, limit, query_filter)
+        return QueryResponse(points=[
+            models.ScoredPoint(
+                id=self._ids[row],
+                version=0,
+                score=score,
+                payload=self._payloads[row] if with_payload else None,
+            )
+            for row, score in hits
+        ])
+
+    def query_batch_points(
+        self,
+        collection_name: Optional[str] = None,
+        requests: Sequence[models.QueryRequest] = (),
+        **kwargs
+    ) -> List[QueryResponse]:
+        """
+        Evaluate several QueryRequest objects, like QdrantClient.query_batch_points.
+        """
+        return [
+            self.query_points(
+                collection_name,
+                query=request.query,
+                using=request.using,
+                prefetch=request.prefetch,
+                limit=request.limit if request.limit is not None else 10,
+                with_payload=request.with_payload if request.with_payload is not None else True,
+                query_filter=request.filter,
+            )
+            for request in requests
+        ]
+
+    # ---- persistence ----
+
+    def save(self, path: str):
+        """
+        Write the live points to a directory that load() can memory-map.
+        """
+        self._finalize()
+        os.makedirs(path, exist_ok=True)
+        live = np.nonzero(self._alive_mask)[0]
+
+        np.save(os.path.join(path, "dense.npy"), self._dense[live])
+        lengths = np.asarray([len(self._sparse_rows[row][0]) for row in live], dtype=np.int64)
+        np.save(os.path.join(path, "sparse_indptr.npy"), np.concatenate([[0], np.cumsum(lengths)]))
+        np.save(os.path.join(path, "sparse_indices.npy"), np.concatenate([self._sparse_rows[row][0] for row in live]) if len(live) else np.zeros(0, dtype=np.int64))
+        np.save(os.path.join(path, "sparse_values.npy"), np.concatenate([self._sparse_rows[row][1] for row in live]) if len(live) else np.zeros(0, dtype=np.float32))
+
+        with open(os.path.join(path, "points.jsonl"), "w", encoding="utf-8") as f:
+            for row in live:
+                f.write(json.dumps({"id": self._ids[row], "payload": self._payloads[row]}, ensure_ascii=False) + "\n")
+
+        print(f"SUCCESS: Saved {len(live)} points to local index '{path}'")
+
+    @classmethod
+    def load(cls, path: str, dense_name: str = "jina-small", sparse_name: str = "bm25") -> "LocalHybridIndex":
+        """
+        Load an index written by save(). Dense vectors are memory-mapped.
+        """
+        dense = np.load(os.path.join(path, "dense.npy"), mmap_mode="r")
+        indptr = np.load(os.path.join(path, "sparse_indptr.npy"))
+        indices = np.load(os.path.join(path, "sparse_indices.npy"))
+        values = np.load(os.path.join(path, "sparse_values.npy"))
+
+        index = cls(embedding_dimensionality=dense.shape[1], dense_name=dense_name, sparse_name=sparse_name)
+        index._dense_base = dense
+        with open(os.path.join(path, "points.jsonl"), "r", encoding="utf-8") as f:
+            for row, line in enumerate(f):
+                point = json.loads(line)
+                index._row_of[str(point["id"])] = row
+                index._ids.append(point["id"])
+                index._payloads.append(point["payload"])
+                index._alive.append(True)
+                index._sparse_rows.append((indices[indptr[row]:indptr[row + 1]], values[indptr[row]:indptr[row + 1]]))
+        return index
+
+
+class AsyncLocalHybridIndex:
+    """
+    Awaitable wrapper around LocalHybridIndex for the async search functions.
+    """
+
+    def __init__(self, index: LocalHybridIndex):
+        self.index = index
+
+    async def query_points(self, *args, **kwargs) -> QueryResponse:
+        return self.index.query_points(*args, **kwargs)
+
+    async def query_batch_points(self, *args, **kwargs) -> List[QueryResponse]:
+        return self.index.query_batch_points(*args, **kwargs)
+
+    async def upsert(self, *args, **kwargs):
+        return self.index.upsert(*args, **kwargs)
+
+    async def count(self, *args, **kwargs) -> models.CountResult:
+        return self.index.count(*args, **kwargs)
+
+
+def build_local_index(
+    path: str = "data/local_index",
+    vector_model_handle: str = "jinaai/jina-embeddings-v2-small-en",
+    embedding_dimensionality: int = 512,
+    sparse_model_handle: str = "Qdrant/bm25",
+    texts_path: str = "data/summarized_texts.json",
+    tables_path: str = "data/summarized_tables.json",
+    batch_size: int = 256,
+    workers: Optional[int] = None,
+    embedding_store_dir: Optional[str] = "data/embeddings"
+) -> LocalHybridIndex:
+    """
+    Build a local index from the knowledge base and save it to `path`.
+
+    Uses the same streaming, parallel embedding and embedding store as
+    vector_store_pipeline(), so building it after a Qdrant ingestion is pure I/O.
+
+    Args:
+        path: Output directory of the index
+        vector_model_handle: Model handle for dense vectors
+        embedding_dimensionality: Size of dense vectors
+        sparse_model_handle: Model handle for sparse vectors
+        texts_path: Path to texts JSON file
+        tables_path: Path to tables JSON file
+        batch_size: Number of chunks embedded per batch
+        workers: Embedding worker processes, defaults to the number of CPUs
+        embedding_store_dir: Directory of the local embedding store, None disables it
+
+    Returns:
+        The built LocalHybridIndex
+    """
+    from data_ingest import iter_data_with_content_types
+    from embedding_store import EmbeddingStore
+    from embedding_workers import EmbeddingPool
+    from table_format import add_compact_tables, report_compaction
+    from vector_store import stream_upsert
+
+    index = LocalHybridIndex(embedding_dimensionality)
+    embedding_store = None
+    if embedding_store_dir:
+        embedding_store = EmbeddingStore(embedding_store_dir, vector_model_handle, sparse_model_handle, embedding_dimensionality)
+
+    table_stats = {}
+    with EmbeddingPool(vector_model_handle, sparse_model_handle, workers) as embedding_pool:
+        stream_upsert(
+            index,
+            None,
+            add_compact_tables(iter_data_with_content_types(texts_path, tables_path), table_stats),
+            embedding_pool,
+            batch_size=batch_size,
+            embedding_store=embedding_store,
+        )
+
+    report_compaction(table_stats)
+
+    index.save(path)
+    return index
+
+
+if __name__ == "__main__":
+    build_local_index()
@@ -0,0 +1,176 @@
+import argparse
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from qdrant_client import QdrantClient, models
+
+from benchmark import BENCHMARK_DIR, latency_stats, sample_queries
+from collection_profiles import COLLECTION_PROFILES, get_profile
+
+# Qdrant only builds the HNSW graph of segments larger than indexing_threshold and searches smaller
+# ones by full scan (both in KB). The wiki corpus is below the defaults, so every profile would be
+# searched exactly; the measured collections lower both so the HNSW settings are what gets measured.
+INDEXING_THRESHOLD_KB = 1
+FULL_SCAN_THRESHOLD_KB = 1
+
+
+def wait_until_indexed(qdClient: QdrantClient, collection_name: str, timeout: float = 600):
+    """
+    Wait until Qdrant has finished optimizing (indexing, quantizing) a collection.
+    """
+    deadline = time.time() + timeout
+    while qdClient.get_collection(collection_name).status != models.CollectionStatus.GREEN:
+        if time.time() > deadline:
+            print(f"WARNING: Collection '{collection_name}' is still being optimized, measuring anyway")
+            return
+        time.sleep(1)
+
+
+def use_hnsw(qdClient: QdrantClient, collection_name: str):
+    """
+    Lower the thresholds of a collection so that its dense vectors are searched through HNSW.
+    """
+    qdClient.update_collection(
+        collection_name,
+        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=INDEXING_THRESHOLD_KB),
+        vectors_config={"jina-small": models.VectorParamsDiff(
+            hnsw_config=models.HnswConfigDiff(full_scan_threshold=FULL_SCAN_THRESHOLD_KB),
+        )},
+    )
+
+
+def measure_profile(
+    qdClient: QdrantClient,
+    collection_name: str,
+    profile_name: str,
+    query_vectors: List[List[float]],
+    k: int = 10,
+    embedding_dimensionality: int = 512
+) -> Dict[str, Any]:
+    """
+    Measure dense recall@k and latency of one collection, and estimate its RAM.
+
+    Recall is measured against exact (brute force, unquantized) search on the
+    same collection, so it only reflects the loss from HNSW and quantization.
+    The RAM figure is computed from the point count and the profile settings
+    (CollectionProfile.estimated_ram_bytes), not measured on the server.
+    """
+    profile = get_profile(profile_name)
+    search_params = profile.search_params()
+    exact_params = models.SearchParams(exact=True, quantization=models.QuantizationSearchParams(ignore=True))
+
+    recalls = []
+    latencies = []
+    for vector in query_vectors:
+        exact = qdClient.query_points(collection_name, query=vector, using="jina-small", limit=k, search_params=exact_params, with_payload=False)
+
+        start = time.perf_counter()
+        approximate = qdClient.query_points(collection_name, query=vector, using="jina-small", limit=k, search_params=search_params, with_payload=False)
+        latencies.append(time.perf_counter() - start)
+
+        expected = {point.id for point in exact.points}
+        if expected:
+            recalls.append(len(expected & {point.id for point in approximate.points}) / len(expected))
+
+    num_points = qdClient.count(collection_name).count
+    indexed = qdClient.get_collection(collection_name).indexed_vectors_count or 0
+    if indexed < num_points:
+        print(f"WARNING: Only {indexed} of {num_points} vectors of '{collection_name}' are in the HNSW index, the rest are searched exactly")
+    return {
+        "profile": profile_name,
+        "collection": collection_name,
+        "points": num_points,
+        "indexed_vectors": indexed,
+        f"recall@{k}": round(sum(recalls) / len(recalls), 4) if recalls else None,
+        **latency_stats(latencies),
+        "estimated_ram_mb": round(profile.estimated_ram_bytes(num_points, embedding_dimensionality) / 2**20, 1),
+    }
+
+
+def measure_profiles(
+    url: str = "http://localhost:6333",
+    profiles: Optional[Sequence[str]] = None,
+    collection_prefix: str = "stardew-sparse-and-dense",
+    num_queries: int = 200,
+    k: int = 10,
+    seed: int = 42,
+    output_dir: str = BENCHMARK_DIR
+) -> str:
+    """
+    Build one collection per profile on a Qdrant server and compare recall, latency and RAM.
+
+    Collections are named `<collection_prefix>-<profile>` and built with
+    vector_store_pipeline(), so vectors come from the local embedding store
+    after the first build. Quantization and HNSW only exist on a server,
+    Qdrant's embedded mode always searches exactly.
+
+    Args:
+        url: Qdrant server URL
+        profiles: Profile names to measure, defaults to all of them
+        collection_prefix: Prefix of the per-profile collection names
+        num_queries: Number of sampled queries
+        k: Cutoff of recall@k
+        seed: Seed of the query sample
+        output_dir: Directory receiving `profiles_<timestamp>.json`
+
+    Returns:
+        Path of the written results file
+    """
+    import RAG_pipeline as pipeline
+    from vector_store import vector_store_pipeline
+
+    profiles = list(profiles or COLLECTION_PROFILES)
+    queries = sample_queries(num_queries, seed)
+    query_vectors = [dense for dense, _ in pipeline.query_embedder.embed_many(queries)]
+    qdClient = QdrantClient(url=url)
+
+    results = []
+    for profile_name in profiles:
+        collection_name = f"{collection_prefix}-{profile_name}"
+        vector_store_pipeline(url=url, collection_name=collection_name, profile=profile_name, content_store_dir=None)
+        use_hnsw(qdClient, collection_name)
+        wait_until_indexed(qdClient, collection_name)
+        row = measure_profile(qdClient, collection_name, profile_name, query_vectors, k, pipeline.EMBEDDING_DIMENSIONALITY)
+        print(
+            f"{profile_name:<12} recall@{k} {row[f'recall@{k}']}, p50 {row['p50_ms']} ms, "
+            f"p95 {row['p95_ms']} ms, estimated RAM ~{row['estimated_ram_mb']} MB (computed, not measured)"
+        )
+        results.append(row)
+
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"profiles_{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "url": url, "num_queries": len(queries), "k": k, "seed": seed,
+                "indexing_threshold_kb": INDEXING_THRESHOLD_KB, "full_scan_threshold_kb": FULL_SCAN_THRESHOLD_KB,
+                "estimated_ram_mb": "computed from point count and profile settings, not measured",
+            },
+            "results": results,
+        }, f, indent=2)
+    print(f"SUCCESS: Saved profile measurements to {path}")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare recall and latency of the collection profiles, with estimated RAM")
+    parser.add_argument("--url", default="http://localhost:6333")
+    parser.add_argument("--profiles", default=None, help=f"Comma separated, from {', '.join(COLLECTION_PROFILES)}")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    measure_profiles(
+        url=args.url,
+        profiles=args.profiles.split(",") if args.profiles else None,
+        num_queries=args.queries,
+        k=args.k,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from data_ingest import _default_paths, load_json
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAW_HTML_DIR = os.path.join(PROJECT_ROOT, "raw_html")
+PARTITION_CACHE = os.path.join(PROJECT_ROOT, "data", "partition_cache.db")
+
+# Bump when the partitioning settings or the chunk extraction below change, so cached results are redone
+PARTITION_VERSION = 1
+MAX_CHARACTERS = 10000
+COMBINE_TEXT_UNDER_N_CHARS = 100
+# Shorter text chunks are mostly captions and navigation leftovers
+MIN_TEXT_CHARS = 100
+# Stays below SQLite's limit on bound parameters per statement
+MAX_KEYS_PER_QUERY = 500
+
+EXCLUDED_SECTIONS = [
+    "references", "reference", "navigation", "navigation menu", "history",
+    "see also", "notes", "external links", "trivia", "gallery",
+    "quotes", "bugs", "changelog", "patch history", "credits",
+    "footnotes", "footer", "acknowledgements", "disclaimer"
+]
+
+Partition = Dict[str, List[Dict[str, Any]]]
+
+
+def should_exclude_section(section_title: str) -> bool:
+    if not section_title:
+        return False
+    normalized = section_title.strip().lower()
+    return any(excluded in normalized for excluded in EXCLUDED_SECTIONS)
+
+
+def partition_file(path: str) -> Optional[Partition]:
+    """
+    Split one saved wiki page into text and table chunks.
+
+    Args:
+        path: HTML file named after its page
+
+    Returns:
+        {"texts": [...], "tables": [...]} in the format of summarized_texts.json
+        and summarized_tables.json (tables without summary), or None if the
+        file could not be partitioned
+    """
+    # Imported here so that only the worker processes pay for loading unstructured
+    from unstructured.documents.elements import CompositeElement, Table, Title
+    from unstructured.partition.html import partition_html
+
+    try:
+        elements = partition_html(
+            filename=path,
+            infer_table_structure=True,
+            strategy="hi_res",
+            chunking_strategy="by_title",
+            include_page_breaks=True,
+            max_characters=MAX_CHARACTERS,
+            combine_text_under_n_chars=COMBINE_TEXT_UNDER_N_CHARS,
+        )
+    except Exception as e:
+        print(f"ERROR: Could not partition {path}: {e}")
+        return None
+
+    page_title = os.path.basename(path).split(".")[0]
+    texts = []
+    tables = []
+
+    for element in elements:
+        # by_title chunks start at a title, so every chunk starts from the page title
+        section_title = page_title
+        # Chunks keep the elements they were built from, which carry the titles and table structure
+        if isinstance(element, CompositeElement):
+            parts = element.metadata.orig_elements or []
+        else:
+            parts = [element]
+
+        for part in parts:
+            if isinstance(part, Title) and isinstance(element, CompositeElement):
+                section_title = part.text.strip()
+            elif should_exclude_section(section_title):
+                continue
+            elif isinstance(part, Table):
+                tables.append({
+                    "page_title": page_title,
+                    "section_title": section_title,
+                    "table_html": part.metadata.text_as_html or part.text or "[No HTML available]",
+                })
+            else:
+                text = (part.text or "").strip()
+                if len(text) >= MIN_TEXT_CHARS:
+                    texts.append({
+                        "page_title": page_title,
+                        "section_title": section_title,
+                        "text": text,
+                    })
+
+    return {"texts": texts, "tables": tables}
+
+
+def partition_key(path: str) -> str:
+    """
+    Cache key of a file: its name (the page title comes from it) and a hash of its HTML.
+    """
+    digest = hashlib.sha256(f"{PARTITION_VERSION}\x00{os.path.basename(path)}\x00".encode("utf-8"))
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class PartitionCache:
+    """
+    SQLite cache of partition results keyed by partition_key(), so unchanged pages are never partitioned twice.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: SQLite file holding the partition results
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS partitions (key TEXT PRIMARY KEY, file TEXT, result TEXT)")
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Partition]:
+        keys = list(keys)
+        rows = []
+        with self._lock:
+            for i in range(0, len(keys), MAX_KEYS_PER_QUERY):
+                chunk = keys[i:i + MAX_KEYS_PER_QUERY]
+                rows += self._db.execute(
+                    f"SELECT key, result FROM partitions WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+        return {key: json.loads(result) for key, result in rows}
+
+    def put(self, key: str, file: str, result: Partition):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO partitions (key, file, result) VALUES (?, ?, ?)",
+                (key, file, json.dumps(result, ensure_ascii=False)),
+            )
+            self._db.commit()
+
+    def prune(self, keep: Iterable[str]) -> int:
+        """
+        Drop the results of files that changed or disappeared since they were cached.
+
+        Returns:
+            Number of dropped results
+        """
+        keep = set(keep)
+        with self._lock:
+            stale = [(key,) for (key,) in self._db.execute("SELECT key FROM partitions") if key not in keep]
+            self._db.executemany("DELETE FROM partitions WHERE key = ?", stale)
+            self._db.commit()
+        return len(stale)
+
+
+def partition_files(
+    paths: Sequence[str],
+    workers: Optional[int] = None,
+    cache: Optional[PartitionCache] = None,
+    prune_cache: bool = False,
+    skip_failed: bool = True
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Partition many HTML files on a pool of worker processes, reusing cached results.
+
+    Files are handed out one at a time, so a few very long pages do not hold
+    up a whole shard. Each result is cached as soon as it arrives, so an
+    interrupted run resumes where it stopped.
+
+    Args:
+        paths: HTML files to partition
+        workers: Number of worker processes, defaults to the number of CPUs; 0 partitions in-process
+        cache: Optional cache of earlier results
+        prune_cache: Drop cached results of files not in `paths`, for runs over the whole corpus
+        skip_failed: Leave out files that failed to partition instead of raising
+
+    Returns:
+        Text chunks and table chunks of all files, in the order of `paths`
+    """
+    keys = {path: partition_key(path) for path in paths}
+    results = cache.get_many(keys.values()) if cache is not None else {}
+    missing = [path for path in paths if keys[path] not in results]
+    print(f"INFO: {len(paths) - len(missing)} of {len(paths)} files unchanged, partitioning {len(missing)}")
+
+    def collect(path, result):
+        if result is None:
+            return
+        results[keys[path]] = result
+        if cache is not None:
+            cache.put(keys[path], os.path.basename(path), result)
+
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    if missing and workers > 0:
+        with ProcessPoolExecutor(max_workers=min(workers, len(missing))) as executor:
+            futures = {executor.submit(partition_file, path): path for path in missing}
+            for done, future in enumerate(as_completed(futures), start=1):
+                collect(futures[future], future.result())
+                if done % 100 == 0 or done == len(futures):
+                    print(f"INFO: Partitioned {done}/{len(futures)} files")
+    else:
+        for path in missing:
+            collect(path, partition_file(path))
+
+    failed = [path for path in paths if keys[path] not in results]
+    if failed and not skip_failed:
+        # The other results are cached, so a rerun only redoes the failed files
+        raise RuntimeError(f"{len(failed)} of {len(paths)} files could not be partitioned, e.g. {failed[0]}")
+    if failed:
+        print(f"WARNING: {len(failed)} of {len(paths)} files could not be partitioned and are left out")
+
+    texts = []
+    tables = []
+    for path in paths:
+        result = results.get(keys[path])
+        if result is not None:
+            texts += result["texts"]
+            tables += result["tables"]
+
+    if cache is not None and prune_cache:
+        cache.prune(keys.values())
+    return texts, tables
+
+
+def partition_pipeline(
+    raw_html_dir: str = RAW_HTML_DIR,
+    texts_path: Optional[str] = None,
+    tables_path: Optional[str] = None,
+    cache_path: Optional[str] = PARTITION_CACHE,
+    workers: Optional[int] = None,
+    skip_failed: bool = False
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Partition the saved wiki pages and write the files read by data_ingestion().
+
+    Tables keep the summary they had in the current tables file when their
+    HTML is unchanged; new or changed tables get an empty summary until
+    they are summarized.
+
+    Args:
+        raw_html_dir: Directory of saved HTML pages
+        texts_path: Output text chunks, defaults to data/summarized_texts.json
+        tables_path: Output table chunks, defaults to data/summarized_tables.json
+        cache_path: SQLite partition cache, None disables caching
+        workers: Number of worker processes, defaults to the number of CPUs
+        skip_failed: Write the outputs without the pages that failed to partition,
+            instead of leaving the current files untouched
+
+    Returns:
+        The text chunks and table chunks that were written
+    """
+    texts_path, tables_path = _default_paths(texts_path, tables_path)
+    paths = sorted(
+        os.path.join(raw_html_dir, name) for name in os.listdir(raw_html_dir)
+        # Skips the .part files a crawl leaves behind while writing
+        if name.endswith(".html") and os.path.isfile(os.path.join(raw_html_dir, name))
+    )
+    cache = PartitionCache(cache_path) if cache_path else None
+    texts, tables = partition_files(paths, workers=workers, cache=cache, prune_cache=True, skip_failed=skip_failed)
+
+    def table_key(table):
+        return table["page_title"], table["section_title"], table["table_html"]
+
+    summaries = {table_key(table): table.get("summary", "") for table in load_json(tables_path)}
+    for table in tables:
+        table["summary"] = summaries.get(table_key(table), "")
+    unsummarized = sum(1 for table in tables if not table["summary"])
+    if unsummarized:
+        print(f"WARNING: {unsummarized} of {len(tables)} tables have no summary yet")
+
+    for path, chunks in ((texts_path, texts), (tables_path, tables)):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(chunks, f, ensure_ascii=False, indent=2)
+    print(f"SUCCESS: Wrote {len(texts)} text chunks to {texts_path} and {len(tables)} table chunks to {tables_path}")
+    return texts, tables
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partition the saved wiki pages into text and table chunks")
+    parser.add_argument("--raw-html", default=RAW_HTML_DIR)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes, 0 to partition in-process")
+    parser.add_argument("--no-cache", action="store_true", help="Partition every file again")
+    parser.add_argument("--skip-failed", action="store_true", help="Write the outputs even if some pages failed")
+    args = parser.parse_args()
+
+    partition_pipeline(
+        args.raw_html,
+        cache_path=None if args.no_cache else PARTITION_CACHE,
+        workers=args.workers,
+        skip_failed=args.skip_failed,
+    )
+
+
+if __name__ == "__main__":
+    main()
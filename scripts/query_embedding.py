@@ -0,0 +1,277 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+from qdrant_client import models
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a query so that trivially different spellings share one cache entry.
+
+    Args:
+        query: Raw user question
+
+    Returns:
+        Query with surrounding whitespace removed and inner whitespace collapsed
+    """
+    return " ".join(query.split())
+
+
+class QueryEmbedder:
+    """
+    Compute dense and sparse query vectors once per normalized query.
+
+    Vectors are kept in a bounded in-memory LRU. When `cache_path` is given,
+    a SQLite file is used as a second tier so that vectors survive restarts
+    and can be shared between app workers on the same host.
+    """
+
+    def __init__(
+        self,
+        vector_model_handle: str,
+        sparse_model_handle: str,
+        max_size: int = 1024,
+        cache_path: Optional[str] = None
+    ):
+        """
+        Args:
+            vector_model_handle: fastembed model handle for dense vectors
+            sparse_model_handle: fastembed model handle for sparse vectors
+            max_size: Maximum number of queries kept in memory
+            cache_path: Optional SQLite file for the on-disk tier
+        """
+        self.vector_model_handle = vector_model_handle
+        self.sparse_model_handle = sparse_model_handle
+        self.max_size = max_size
+        self.cache_path = cache_path
+
+        self._dense_model = None
+        self._sparse_model = None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.misses = 0
+
+        if cache_path:
+            os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+            self._db = sqlite3.connect(cache_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_vectors ("
+                "key TEXT PRIMARY KEY, dense BLOB, sparse_indices BLOB, sparse_values BLOB)"
+            )
+            self._db.commit()
+
+    def _load_models(self):
+        # fastembed is imported lazily so that importing the pipeline stays cheap
+        with self._lock:
+            if self._dense_model is None:
+                from fastembed import SparseTextEmbedding, TextEmbedding
+                self._dense_model = TextEmbedding(self.vector_model_handle)
+                self._sparse_model = SparseTextEmbedding(self.sparse_model_handle)
+
+    def _key(self, normalized: str) -> str:
+        raw = f"{self.vector_model_handle}\x00{self.sparse_model_handle}\x00{normalized}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vectors: Tuple[List[float], models.SparseVector]):
+        self._cache[key] = vectors
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def _get_from_disk(self, key: str):
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT dense, sparse_indices, sparse_values FROM query_vectors WHERE key = ?",
+            (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        dense = np.frombuffer(row[0], dtype=np.float32).tolist()
+        sparse = models.SparseVector(
+            indices=np.frombuffer(row[1], dtype=np.int64).tolist(),
+            values=np.frombuffer(row[2], dtype=np.float32).tolist(),
+        )
+        return dense, sparse
+
+    def _put_on_disk(self, entries):
+        if self._db is None or not entries:
+            return
+        self._db.executemany(
+            "INSERT OR REPLACE INTO query_vectors VALUES (?, ?, ?, ?)",
+            [
+                (
+                    key,
+                    np.asarray(dense, dtype=np.float32).tobytes(),
+                    np.asarray(sparse.indices, dtype=np.int64).tobytes(),
+                    np.asarray(sparse.values, dtype=np.float32).tobytes(),
+                )
+                for key, (dense, sparse) in entries
+            ]
+        )
+        self._db.commit()
+
+    def embed_many(self, queries: List[str]) -> List[Tuple[List[float], models.SparseVector]]:
+        """
+        Return (dense, sparse) query vectors for each query, embedding only cache misses.
+
+        All misses are embedded together in one batched call per model.
+
+        Args:
+            queries: List of raw user questions
+
+        Returns:
+            List of (dense vector, SparseVector) tuples in the order of `queries`
+        """
+        keys = [self._key(normalize_query(q)) for q in queries]
+        found = {}
+        missing = {}
+
+        with self._lock:
+            for key, query in zip(keys, queries):
+                if key in found or key in missing:
+                    continue
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    found[key] = self._cache[key]
+                    continue
+                vectors = self._get_from_disk(key)
+                if vectors is not None:
+                    self._remember(key, vectors)
+                    found[key] = vectors
+                else:
+                    missing[key] = normalize_query(query)
+            self.hits += len(queries) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            self._load_models()
+            texts = list(missing.values())
+            dense_vectors = list(self._dense_model.query_embed(texts))
+            sparse_vectors = list(self._sparse_model.query_embed(texts))
+            computed = []
+            for key, dense, sparse in zip(missing, dense_vectors, sparse_vectors):
+                vectors = (
+                    dense.tolist(),
+                    models.SparseVector(
+                        indices=sparse.indices.tolist(),
+                        values=sparse.values.tolist(),
+                    ),
+                )
+                found[key] = vectors
+                computed.append((key, vectors))
+
+            with self._lock:
+                for key, vectors in computed:
+                    self._remember(key, vectors)
+                self._put_on_disk(computed)
+
+        return [found[key] for key in keys]
+
+    def embed(self, query: str) -> Tuple[List[float], models.SparseVector]:
+        """
+        Return (dense, sparse) query vectors for a single query.
+
+        Args:
+            query: Raw user question
+
+        Returns:
+            Tuple of dense vector and SparseVector
+        """
+        return self.embed_many([query])[0]
+
+    def warm_up(self):
+        """
+        Load the models and run one inference, so the first real query pays neither; the cache is untouched.
+        """
+        self._load_models()
+        list(self._dense_model.query_embed(["warm up"]))
+        list(self._sparse_model.query_embed(["warm up"]))
+
+    def clear(self):
+        """
+        Drop the in-memory tier. The on-disk tier is left untouched.
+        """
+        with self._lock:
+            self._cache.clear()
+
+
+class MicroBatchEmbedder:
+    """
+    Coalesce concurrent async queries into one QueryEmbedder.embed_many() call.
+
+    The first query of a batch waits at most `max_wait_ms` for others to
+    join, and a full batch is sent right away. Cached queries still skip the
+    models, since the batch goes through the wrapped embedder. Sync callers
+    (`embed`, `embed_many`) bypass batching. Use one instance per event loop.
+    """
+
+    def __init__(self, embedder: QueryEmbedder, max_batch_size: int = 32, max_wait_ms: float = 5):
+        """
+        Args:
+            embedder: QueryEmbedder doing the actual work
+            max_batch_size: Maximum number of queries per embedding call
+            max_wait_ms: Longest time a query waits for a batch to fill
+        """
+        self.embedder = embedder
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle = None
+        self._tasks = set()
+        self.batches = 0
+        self.queries = 0
+
+    def embed(self, query: str) -> Tuple[List[float], models.SparseVector]:
+        return self.embedder.embed(query)
+
+    def embed_many(self, queries: List[str]) -> List[Tuple[List[float], models.SparseVector]]:
+        return self.embedder.embed_many(queries)
+
+    async def aembed(self, query: str) -> Tuple[List[float], models.SparseVector]:
+        """
+        Return (dense, sparse) query vectors, computed together with the other queries of its batch.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((query, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait_ms / 1000, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            # Keep a reference, the event loop only holds tasks weakly
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]):
+        self.batches += 1
+        self.queries += len(batch)
+        try:
+            vectors = await asyncio.to_thread(self.embedder.embed_many, [query for query, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        # Requests cancelled while waiting (e.g. closed connections) have nobody left to answer
+        for (_, future), result in zip(batch, vectors):
+            if not future.done():
+                future.set_result(result)
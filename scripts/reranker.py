@@ -0,0 +1,159 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, List, Optional
+
+from query_embedding import normalize_query
+
+# Cross-encoders read at most 512 tokens, so longer bodies are cut before tokenization
+MAX_DOCUMENT_CHARS = 2000
+# Used until the first batch has been timed; deliberately pessimistic for a small CPU model
+INITIAL_SECONDS_PER_CANDIDATE = 0.01
+# Weight of the newest measurement in the running per-candidate cost
+COST_SMOOTHING = 0.3
+
+
+def document_text(payload: dict) -> str:
+    """
+    Text the cross-encoder reads for one retrieved chunk: its titles and its body.
+    """
+    if payload.get("content_type") == "table":
+        body = payload.get("table_markdown") or payload.get("summary") or payload.get("table_html", "")
+    else:
+        body = payload.get("text", "")
+    return f"{payload.get('page_title', '')} - {payload.get('section_title', '')}\n{body}"[:MAX_DOCUMENT_CHARS]
+
+
+class CrossEncoderReranker:
+    """
+    Rescore fused candidates with a small ONNX cross-encoder on CPU, within a latency budget.
+
+    All candidates that need scoring go through the model in one batch.
+    Scores are kept per (normalized query, point id), so repeated questions
+    and overlapping candidate lists only pay for new points. The cost per
+    candidate is measured on every batch; when scoring the whole list would
+    exceed `latency_budget_ms`, only the best fused candidates that fit are
+    reranked and the rest keep their fused order below them. If fewer than
+    `min_candidates` fit, reranking is skipped.
+    """
+
+    def __init__(
+        self,
+        model_handle: str,
+        latency_budget_ms: float = 150,
+        min_candidates: int = 2,
+        cache_size: int = 10000
+    ):
+        """
+        Args:
+            model_handle: fastembed cross-encoder handle
+            latency_budget_ms: Maximum time spent in the model per query
+            min_candidates: Below this many affordable candidates reranking is skipped
+            cache_size: Maximum number of cached (query, point) scores
+        """
+        self.model_handle = model_handle
+        self.latency_budget_ms = latency_budget_ms
+        self.min_candidates = min_candidates
+        self.cache_size = cache_size
+
+        self._model = None
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+        self._seconds_per_candidate = INITIAL_SECONDS_PER_CANDIDATE
+        self.reranked = 0
+        self.shrunk = 0
+        self.skipped = 0
+
+    def _load_model(self):
+        # fastembed is imported lazily so that importing the pipeline stays cheap
+        with self._lock:
+            if self._model is None:
+                from fastembed.rerank.cross_encoder import TextCrossEncoder
+                self._model = TextCrossEncoder(self.model_handle)
+
+    def warm_up(self):
+        """
+        Load the model and time one small batch, so the budget starts from a measured cost.
+        """
+        self._load_model()
+        documents = ["warm up document"] * self.min_candidates
+        # The first call also pays for setting up the session, so the cost is taken from the second
+        self._score("warm up", documents)
+        self._score("warm up", documents, smoothing=1.0)
+
+    def _score(self, query: str, documents: List[str], smoothing: float = COST_SMOOTHING) -> List[float]:
+        start = time.perf_counter()
+        scores = list(self._model.rerank(query, documents, batch_size=max(len(documents), 1)))
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            measured = elapsed / max(len(documents), 1)
+            self._seconds_per_candidate += smoothing * (measured - self._seconds_per_candidate)
+        return scores
+
+    def affordable_candidates(self, latency_budget_ms: Optional[float] = None) -> int:
+        """
+        How many uncached candidates fit in the budget at the measured cost per candidate.
+        """
+        budget = self.latency_budget_ms if latency_budget_ms is None else latency_budget_ms
+        return int(budget / 1000 / self._seconds_per_candidate)
+
+    def rerank(self, query: str, points: List[Any], latency_budget_ms: Optional[float] = None) -> List[Any]:
+        """
+        Reorder scored points by cross-encoder score, best first.
+
+        Args:
+            query: User question
+            points: Hydrated scored points in fused order
+            latency_budget_ms: Overrides the budget of this reranker for one call
+
+        Returns:
+            The same points, reranked as far as the budget allows; reranked
+            points get the cross-encoder score as their `score`
+        """
+        if not points:
+            return points
+        self._load_model()
+        normalized = normalize_query(query)
+        keys = [(normalized, str(point.id)) for point in points]
+
+        with self._lock:
+            cached = {key: self._scores[key] for key in keys if key in self._scores}
+
+        # Cached points are free, so the list is cut where the uncached ones stop fitting
+        affordable = self.affordable_candidates(latency_budget_ms)
+        cutoff = 0
+        uncached = 0
+        for key in keys:
+            if key not in cached:
+                if uncached == affordable:
+                    break
+                uncached += 1
+            cutoff += 1
+
+        if cutoff < min(self.min_candidates, len(points)):
+            self.skipped += 1
+            return points
+        if cutoff < len(points):
+            self.shrunk += 1
+        self.reranked += 1
+
+        head = points[:cutoff]
+        missing = [(key, point) for key, point in zip(keys, head) if key not in cached]
+        if missing:
+            scores = self._score(query, [document_text(point.payload) for _, point in missing])
+            new_scores = {key: float(score) for (key, _), score in zip(missing, scores)}
+            cached.update(new_scores)
+            with self._lock:
+                for key, score in new_scores.items():
+                    self._scores[key] = score
+                    self._scores.move_to_end(key)
+                while len(self._scores) > self.cache_size:
+                    self._scores.popitem(last=False)
+
+        for key, point in zip(keys, head):
+            point.score = cached[key]
+        return sorted(head, key=lambda point: point.score, reverse=True) + points[cutoff:]
+
+    def clear(self):
+        with self._lock:
+            self._scores.clear()
@@ -0,0 +1,114 @@
+import argparse
+import os
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Literal, Optional
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+
+import RAG_pipeline as pipeline
+from clients import get_async_openai_client, get_async_qdrant_client
+from query_embedding import MicroBatchEmbedder
+from tracing import tracer
+
+# Concurrent queries are embedded together; a query waits at most this long for others to join
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", 32))
+EMBED_MAX_WAIT_MS = float(os.environ.get("EMBED_MAX_WAIT_MS", 5))
+
+SEARCH_METHODS = {
+    "rrf": pipeline.arrf_search,
+    "multi_stage": pipeline.amulti_stage_search,
+    "rerank": pipeline.arerank_search,
+}
+
+embedder = MicroBatchEmbedder(pipeline.query_embedder, max_batch_size=EMBED_BATCH_SIZE, max_wait_ms=EMBED_MAX_WAIT_MS)
+
+
+class SearchRequest(BaseModel):
+    query: str
+    limit: int = Field(5, ge=1, le=50)
+    method: Literal["rrf", "multi_stage", "rerank"] = "rrf"
+    content_type: Optional[Literal["text", "table"]] = None
+    page_title: Optional[str] = None
+
+
+class AnswerRequest(BaseModel):
+    query: str
+    model: str = "gpt-5-mini"
+    rerank: bool = False
+    stream: bool = False
+    content_type: Optional[Literal["text", "table"]] = None
+    page_title: Optional[str] = None
+
+
+def _point(point) -> Dict[str, Any]:
+    return {"id": str(point.id), "score": point.score, "payload": point.payload}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Each worker process loads the models and builds its pooled clients once, before taking traffic.
+    # The async clients belong to the server's event loop, which closes them when it shuts down.
+    pipeline.query_embedder.warm_up()
+    try:
+        # The first reranked request would otherwise load the cross-encoder inside its latency budget
+        pipeline.reranker.warm_up()
+    except Exception as e:
+        print(f"WARNING: Could not load the reranker, reranked requests will load it: {e}")
+    get_async_qdrant_client()
+    get_async_openai_client()
+    yield
+
+
+app = FastAPI(title="Stardew Valley RAG Assistant", lifespan=lifespan)
+
+
+@app.get("/health")
+async def health() -> Dict[str, Any]:
+    return {"status": "ok", "embedding_batches": embedder.batches, "embedded_queries": embedder.queries}
+
+
+@app.post("/search")
+async def search(request: SearchRequest) -> Dict[str, List[Dict[str, Any]]]:
+    query_filter = pipeline.build_filter(content_type=request.content_type, page_title=request.page_title)
+    with tracer.trace("search", method=request.method):
+        results = await SEARCH_METHODS[request.method](
+            query=request.query, limit=request.limit, embedder=embedder, query_filter=query_filter
+        )
+    return {"results": [_point(point) for point in results]}
+
+
+@app.post("/answer")
+async def answer(request: AnswerRequest):
+    query_filter = pipeline.build_filter(content_type=request.content_type, page_title=request.page_title)
+    options = dict(model=request.model, query_filter=query_filter, rerank=request.rerank, embedder=embedder)
+    if request.stream:
+        # Plain text deltas, flushed as the model generates them
+        return StreamingResponse(pipeline.arag_stream(request.query, **options), media_type="text/plain; charset=utf-8")
+    return {"answer": await pipeline.arag(request.query, **options)}
+
+
+@app.get("/stats")
+async def stats() -> List[Dict[str, Any]]:
+    """
+    p50/p95/p99 per stage over the recent requests of this worker.
+    """
+    return tracer.summary()
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve search and answers over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes, each with its own models and clients")
+    args = parser.parse_args()
+
+    # Workers import the app by name, from this directory
+    uvicorn.run("service:app", host=args.host, port=args.port, workers=args.workers, app_dir=os.path.dirname(os.path.abspath(__file__)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+class StubOpenAIServer:
+    """
+    Minimal OpenAI-compatible chat completions server for offline benchmarks.
+
+    Answers `POST /v1/chat/completions` with a fixed answer after a
+    configurable delay, both as a single response and as a server-sent event
+    stream (including the final usage chunk), so the real `OpenAI` client and
+    the whole rag() path run unchanged without network access or API cost.
+
+    Usage:
+        with StubOpenAIServer(time_to_first_token=0.2) as server:
+            client = OpenAI(base_url=server.base_url, api_key="stub")
+    """
+
+    def __init__(
+        self,
+        time_to_first_token: float = 0.0,
+        time_per_token: float = 0.0,
+        completion_tokens: int = 64,
+        host: str = "127.0.0.1",
+        port: int = 0
+    ):
+        """
+        Args:
+            time_to_first_token: Seconds before the first token is sent
+            time_per_token: Seconds between subsequent tokens
+            completion_tokens: Number of tokens in every answer
+            host: Interface to bind
+            port: Port to bind, 0 picks a free one
+        """
+        self.time_to_first_token = time_to_first_token
+        self.time_per_token = time_per_token
+        self.completion_tokens = completion_tokens
+        self.requests = 0
+
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                stub.requests += 1
+                model = body.get("model", "stub")
+                prompt = " ".join(str(message.get("content", "")) for message in body.get("messages", []))
+                # Rough whitespace count, close enough for relative comparisons
+                usage = {
+                    "prompt_tokens": len(prompt.split()),
+                    "completion_tokens": stub.completion_tokens,
+                    "total_tokens": len(prompt.split()) + stub.completion_tokens,
+                }
+                tokens = ["word "] * stub.completion_tokens
+
+                if body.get("stream"):
+                    self._stream(model, tokens, usage)
+                    return
+
+                time.sleep(stub.time_to_first_token + stub.time_per_token * max(0, len(tokens) - 1))
+                self._send_json({
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "".join(tokens).strip()},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": usage,
+                })
+
+            def _send_json(self, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, model, tokens, usage):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+
+                def event(choices, usage=None):
+                    chunk = {
+                        "id": "chatcmpl-stub",
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": choices,
+                        "usage": usage,
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+
+                time.sleep(stub.time_to_first_token)
+                for i, token in enumerate(tokens):
+                    if i:
+                        time.sleep(stub.time_per_token)
+                    event([{"index": 0, "delta": {"content": token}, "finish_reason": None}])
+                event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+                event([], usage)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
+
+    def start(self) -> "StubOpenAIServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
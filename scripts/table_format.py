@@ -0,0 +1,145 @@
+import re
+from html.parser import HTMLParser
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+
+class _TableParser(HTMLParser):
+    """
+    Collect the cell texts of an HTML table row by row, expanding colspan and rowspan.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows: List[List[str]] = []
+        self.header_rows = 0
+        self._row: Optional[List[str]] = None
+        self._row_is_header = False
+        self._cell: Optional[List[str]] = None
+        self._colspan = 1
+        self._rowspan = 1
+        # Column index -> (text, rows still to fill) for cells spanning several rows
+        self._pending: Dict[int, List[Any]] = {}
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "tr":
+            self._row = []
+            self._row_is_header = True
+        elif tag in ("td", "th") and self._row is not None:
+            attrs = dict(attrs)
+            self._cell = []
+            self._colspan = _span(attrs.get("colspan"))
+            self._rowspan = _span(attrs.get("rowspan"))
+            self._row_is_header = self._row_is_header and tag == "th"
+        elif tag == "br" and self._cell is not None:
+            self._cell.append(" ")
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+    def handle_endtag(self, tag):
+        if tag in ("td", "th") and self._cell is not None:
+            self._fill_pending()
+            text = re.sub(r"\s+", " ", "".join(self._cell)).strip().replace("|", "\\|")
+            for _ in range(self._colspan):
+                if self._rowspan > 1:
+                    self._pending[len(self._row)] = [text, self._rowspan - 1]
+                self._row.append(text)
+            self._cell = None
+        elif tag == "tr" and self._row is not None:
+            self._fill_pending(trailing=True)
+            if self._row:
+                if self._row_is_header and len(self.rows) == self.header_rows:
+                    self.header_rows += 1
+                self.rows.append(self._row)
+            self._row = None
+
+    def _fill_pending(self, trailing: bool = False):
+        # Insert values carried down by rowspan at their column
+        while self._pending:
+            column = len(self._row)
+            if column not in self._pending:
+                if not trailing or column > max(self._pending):
+                    return
+                self._row.append("")
+                continue
+            text, remaining = self._pending[column]
+            self._row.append(text)
+            if remaining > 1:
+                self._pending[column][1] -= 1
+            else:
+                del self._pending[column]
+
+
+def _span(value: Optional[str]) -> int:
+    try:
+        return max(1, min(int(value), 100))
+    except (TypeError, ValueError):
+        return 1
+
+
+def html_table_to_markdown(table_html: str) -> str:
+    """
+    Convert an HTML table to a compact markdown table.
+
+    Tags, attributes and whitespace are dropped; colspan and rowspan cells
+    are repeated so every row has the same columns. The first row is used as
+    the header when the table has no `<th>` row.
+
+    Args:
+        table_html: HTML of one table, as produced by unstructured
+
+    Returns:
+        Markdown table, or an empty string if the table has no cells
+    """
+    parser = _TableParser()
+    parser.feed(table_html)
+    parser.close()
+    rows = parser.rows
+    if not rows:
+        return ""
+
+    width = max(len(row) for row in rows)
+    rows = [row + [""] * (width - len(row)) for row in rows]
+    header_rows = max(1, parser.header_rows)
+
+    lines = ["| " + " | ".join(row) + " |" for row in rows]
+    lines.insert(header_rows, "|" + "---|" * width)
+    return "\n".join(lines)
+
+
+def add_compact_tables(chunks: Iterable[Dict[str, Any]], stats: Optional[Dict[str, int]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Add a `table_markdown` field next to `table_html` on every table chunk of a stream.
+
+    Chunks that already carry `table_markdown` are passed through untouched.
+
+    Args:
+        chunks: Text and table chunks tagged with their content type
+        stats: Optional dict accumulating `tables`, `html_chars` and `markdown_chars`
+
+    Yields:
+        The chunks, tables with their compact form added
+    """
+    for chunk in chunks:
+        if chunk.get("content_type") == "table" and chunk.get("table_html"):
+            if "table_markdown" not in chunk:
+                chunk["table_markdown"] = html_table_to_markdown(chunk["table_html"])
+            if stats is not None:
+                stats["tables"] = stats.get("tables", 0) + 1
+                stats["html_chars"] = stats.get("html_chars", 0) + len(chunk["table_html"])
+                stats["markdown_chars"] = stats.get("markdown_chars", 0) + len(chunk["table_markdown"])
+        yield chunk
+
+
+def report_compaction(stats: Dict[str, int]):
+    """
+    Print how much smaller the compact tables are than their HTML.
+    """
+    if not stats.get("tables"):
+        return
+    reduction = 1 - stats["markdown_chars"] / max(1, stats["html_chars"])
+    print(
+        f"INFO: Compact tables: {stats['tables']} tables, {stats['html_chars']:,} HTML chars -> "
+        f"{stats['markdown_chars']:,} markdown chars ({reduction:.0%} smaller)"
+    )
@@ -0,0 +1,235 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+from openai import AsyncOpenAI
+
+from data_ingest import _default_paths, load_json
+from llm_jobs import RETRY_ERRORS, retry_after, run_async
+from partitioning import PROJECT_ROOT
+
+SUMMARY_STORE = os.path.join(PROJECT_ROOT, "data", "table_summaries.db")
+SUMMARY_MODEL = "gpt-5-nano"
+# Bump when summarize_prompt changes, so stored summaries are redone
+SUMMARY_PROMPT_VERSION = 1
+MAX_CONCURRENT = 15
+RETRY_LIMIT = 5
+BACKOFF_BASE = 2            # seconds, doubled on every attempt
+# Long tables are cut to avoid token overflow
+MAX_TABLE_CHARS = 8000
+
+summarize_prompt = """
+You are an assistant tasked with summarizing the tables.
+Give a concise and short summary of the table.
+
+Respond only with the summary, no additionnal comment.
+Do not start your message by saying "Here is a summary" or anything like that.
+Just give the summary as it is.
+
+Table chunk: {element}
+"""
+
+
+def table_hash(table_html: str) -> str:
+    return hashlib.sha256(table_html.encode("utf-8")).hexdigest()
+
+
+class SummaryStore:
+    """
+    SQLite store of table summaries keyed by (table content hash, prompt version, model).
+
+    Every summary is committed as soon as it is written, so the store doubles
+    as the checkpoint of a summarization run.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: SQLite file holding the summaries
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            "table_hash TEXT, prompt_version INTEGER, model TEXT, summary TEXT, "
+            "PRIMARY KEY (table_hash, prompt_version, model))"
+        )
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    def get(self, table_hash: str, model: str, prompt_version: int = SUMMARY_PROMPT_VERSION) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT summary FROM summaries WHERE table_hash = ? AND prompt_version = ? AND model = ?",
+                (table_hash, prompt_version, model),
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, table_hash: str, model: str, summary: str, prompt_version: int = SUMMARY_PROMPT_VERSION):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO summaries (table_hash, prompt_version, model, summary) VALUES (?, ?, ?, ?)",
+                (table_hash, prompt_version, model, summary),
+            )
+            self._db.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+
+
+async def summarize_table(table_html: str, sem: asyncio.Semaphore, client: AsyncOpenAI, model: str = SUMMARY_MODEL) -> Optional[str]:
+    """Summarize one table with retry + backoff. Returns None after RETRY_LIMIT failures."""
+    prompt = summarize_prompt.format(element=table_html[:MAX_TABLE_CHARS])
+
+    async with sem:
+        for attempt in range(RETRY_LIMIT):
+            try:
+                response = await client.chat.completions.create(
+                    model=model,
+                    messages=[{"role": "user", "content": prompt}],
+                    timeout=60,
+                )
+                summary = response.choices[0].message.content
+                return re.sub(r"<think>.*?</think>", "", summary, flags=re.DOTALL).strip()
+
+            except RETRY_ERRORS as e:
+                wait_time = retry_after(e) or BACKOFF_BASE * (2 ** attempt) + random.random()
+                print(f"Rate/API error ({attempt+1}/{RETRY_LIMIT}): waiting {wait_time:.1f}s -> {type(e).__name__}")
+                await asyncio.sleep(wait_time)
+
+    return None
+
+
+async def summarize_tables_async(
+    tables: List[Dict[str, Any]],
+    store: SummaryStore,
+    model: str = SUMMARY_MODEL,
+    max_concurrent: int = MAX_CONCURRENT
+) -> Dict[str, int]:
+    """
+    Fill the `summary` of every table, from the store when possible.
+
+    Tables with the same HTML share one LLM call, and every new summary is
+    stored right away, so an interrupted run resumes where it stopped.
+    Tables that still fail keep their current (possibly empty) summary.
+
+    Returns:
+        Counts of summaries taken from the store, newly generated and failed
+    """
+    counts = {"stored": 0, "generated": 0, "failed": 0}
+    by_hash: Dict[str, List[Dict[str, Any]]] = {}
+    for table in tables:
+        if not table.get("table_html"):
+            table["summary"] = "[No table HTML]"
+            continue
+        by_hash.setdefault(table_hash(table["table_html"]), []).append(table)
+
+    missing = {}
+    for key, group in by_hash.items():
+        summary = store.get(key, model)
+        if summary is None:
+            missing[key] = group
+            continue
+        counts["stored"] += len(group)
+        for table in group:
+            table["summary"] = summary
+    print(f"INFO: {counts['stored']} of {len(tables)} table summaries found in the store, summarizing {len(missing)} distinct tables")
+
+    sem = asyncio.Semaphore(max_concurrent)
+
+    async def one(key, group):
+        summary = await summarize_table(group[0]["table_html"], sem, client, model=model)
+        if summary is None:
+            # A table keeps the summary it had, if any
+            counts["failed"] += len(group)
+            for table in group:
+                table.setdefault("summary", "")
+            return
+        store.put(key, model, summary)
+        counts["generated"] += len(group)
+        done = counts["generated"] + counts["failed"]
+        if done % 100 == 0:
+            print(f"INFO: Summarized {done}/{sum(len(group) for group in missing.values())} tables")
+        for table in group:
+            table["summary"] = summary
+
+    # A client per run, since every run gets a new event loop from run_async()
+    async with AsyncOpenAI() as client:
+        await asyncio.gather(*(one(key, group) for key, group in missing.items()))
+    return counts
+
+
+def summarize_tables(
+    tables: List[Dict[str, Any]],
+    store_path: str = SUMMARY_STORE,
+    model: str = SUMMARY_MODEL,
+    max_concurrent: int = MAX_CONCURRENT
+) -> Dict[str, int]:
+    """Sync wrapper for normal scripts"""
+    return run_async(summarize_tables_async(tables, SummaryStore(store_path), model=model, max_concurrent=max_concurrent))
+
+
+def summarize_pipeline(
+    tables_path: Optional[str] = None,
+    store_path: str = SUMMARY_STORE,
+    model: str = SUMMARY_MODEL,
+    resummarize: bool = False,
+    max_concurrent: int = MAX_CONCURRENT
+) -> List[Dict[str, Any]]:
+    """
+    Summarize the tables written by partitioning.partition_pipeline(), in place.
+
+    Only tables without a summary are sent, which after a wiki refresh are
+    the new and changed ones, and tables already summarized by an earlier
+    (possibly interrupted) run come from the store.
+
+    Args:
+        tables_path: Table chunks, defaults to data/summarized_tables.json
+        store_path: SQLite summary store
+        model: Model writing the summaries
+        resummarize: Summarize every table again, e.g. after changing the model or prompt
+        max_concurrent: Concurrent LLM requests
+
+    Returns:
+        The table chunks that were written
+    """
+    _, tables_path = _default_paths(None, tables_path)
+    tables = load_json(tables_path)
+    todo = tables if resummarize else [table for table in tables if not table.get("summary")]
+    counts = {"stored": 0, "generated": 0, "failed": 0}
+    if todo:
+        counts = summarize_tables(todo, store_path, model=model, max_concurrent=max_concurrent)
+        if counts["failed"]:
+            print(f"WARNING: {counts['failed']} tables could not be summarized, run again to retry them")
+
+    with open(tables_path, "w", encoding="utf-8") as f:
+        json.dump(tables, f, ensure_ascii=False, indent=2)
+    print(
+        f"SUCCESS: Saved {len(tables)} tables to {tables_path} ({len(tables) - len(todo)} kept their summary, "
+        f"{counts['stored']} from the store, {counts['generated']} newly summarized)"
+    )
+    return tables
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize the table chunks, reusing stored summaries")
+    parser.add_argument("--model", default=SUMMARY_MODEL)
+    parser.add_argument("--resummarize", action="store_true", help="Summarize every table again, not only those without a summary")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENT)
+    args = parser.parse_args()
+
+    summarize_pipeline(model=args.model, resummarize=args.resummarize, max_concurrent=args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import numpy as np
+
+
+# The trace of the request being handled in the current thread or asyncio task
+_current_trace: ContextVar[Optional[Dict[str, Any]]] = ContextVar("current_trace", default=None)
+
+
+class Tracer:
+    """
+    Per-stage latency and token instrumentation for the query path.
+
+    Every span and value is kept in a rolling window per name, from which
+    p50/p95/p99 are computed. Spans opened inside `trace()` are also
+    attached to that request's trace, which is written as one JSON line to
+    `sink_path` when the request finishes.
+    """
+
+    def __init__(self, window: int = 1000, sink_path: Optional[str] = None):
+        """
+        Args:
+            window: Number of most recent samples kept per name
+            sink_path: Optional JSON-lines file receiving one record per finished trace
+        """
+        self.window = window
+        self.sink_path = sink_path
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, value: float):
+        """
+        Add a sample (milliseconds for spans, counts for tokens) to the rolling window of `name`.
+        """
+        with self._lock:
+            if name not in self._samples:
+                self._samples[name] = deque(maxlen=self.window)
+            self._samples[name].append(value)
+
+    @contextmanager
+    def span(self, name: str):
+        """
+        Time a stage in milliseconds and attach it to the current trace, if any.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, (time.perf_counter() - start) * 1000)
+
+    def add_span(self, name: str, elapsed_ms: float):
+        """
+        Record a stage timed by the caller, e.g. one that spans the yields of a generator.
+        """
+        self.record(name, elapsed_ms)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace["spans_ms"][name] = trace["spans_ms"].get(name, 0.0) + elapsed_ms
+
+    def add_tokens(self, prompt_tokens: Optional[int], completion_tokens: Optional[int]):
+        """
+        Record the token usage of an LLM call.
+        """
+        trace = _current_trace.get()
+        for name, count in (("prompt_tokens", prompt_tokens), ("completion_tokens", completion_tokens)):
+            if count is None:
+                continue
+            self.record(name, count)
+            if trace is not None:
+                trace["tokens"][name] = trace["tokens"].get(name, 0) + count
+
+    def annotate(self, **attributes):
+        """
+        Attach attributes such as the model name to the current trace.
+        """
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.update(attributes)
+
+    @contextmanager
+    def trace(self, name: str, **attributes):
+        """
+        Open a request-level trace; nested spans are collected into it.
+
+        If a trace is already open, this behaves like a plain span so that
+        e.g. rag() called from another traced function is not double counted.
+        """
+        if _current_trace.get() is not None:
+            with self.span(name):
+                yield _current_trace.get()
+            return
+
+        trace = self._open(name, attributes)
+        token = _current_trace.set(trace)
+        start = time.perf_counter()
+        try:
+            yield trace
+        finally:
+            _current_trace.reset(token)
+            self._close(name, trace, start, nested=False)
+
+    def trace_stream(self, name: str, stream: Iterator, **attributes) -> Iterator:
+        """
+        trace() for a generator such as rag_stream().
+
+        The trace is only current while `stream` runs, never across a yield,
+        so a consumer that abandons the stream is not left inside it.
+        """
+        nested = _current_trace.get() is not None
+        trace = _current_trace.get() if nested else self._open(name, attributes)
+        start = time.perf_counter()
+        try:
+            while True:
+                token = _current_trace.set(trace)
+                try:
+                    item = next(stream)
+                except StopIteration:
+                    return
+                finally:
+                    _current_trace.reset(token)
+                yield item
+        finally:
+            token = _current_trace.set(trace)
+            try:
+                stream.close()
+            finally:
+                _current_trace.reset(token)
+                self._close(name, trace, start, nested)
+
+    async def atrace_stream(self, name: str, stream: AsyncIterator, **attributes) -> AsyncIterator:
+        """
+        trace_stream() for an async generator such as arag_stream().
+        """
+        nested = _current_trace.get() is not None
+        trace = _current_trace.get() if nested else self._open(name, attributes)
+        start = time.perf_counter()
+        try:
+            while True:
+                token = _current_trace.set(trace)
+                try:
+                    item = await stream.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    _current_trace.reset(token)
+                yield item
+        finally:
+            # aclose() may come from another task, so the trace is set in whichever context runs this
+            token = _current_trace.set(trace)
+            try:
+                await stream.aclose()
+            finally:
+                _current_trace.reset(token)
+                self._close(name, trace, start, nested)
+
+    @staticmethod
+    def _open(name: str, attributes: Dict[str, Any]) -> Dict[str, Any]:
+        return {"name": name, "timestamp": time.time(), "spans_ms": {}, "tokens": {}, **attributes}
+
+    def _close(self, name: str, trace: Dict[str, Any], start: float, nested: bool):
+        total = (time.perf_counter() - start) * 1000
+        if nested:
+            # Counted as a span of the enclosing trace, like trace() does
+            self.record(name, total)
+            trace["spans_ms"][name] = trace["spans_ms"].get(name, 0.0) + total
+            return
+        trace["total_ms"] = total
+        self.record(name, total)
+        self._write(trace)
+
+    def _write(self, trace: Dict[str, Any]):
+        if not self.sink_path:
+            return
+        line = json.dumps(trace, ensure_ascii=False, default=str)
+        with self._lock:
+            with open(self.sink_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """
+        Return count, p50, p95 and p99 for every recorded name.
+        """
+        with self._lock:
+            snapshot = {name: np.asarray(samples) for name, samples in self._samples.items()}
+
+        rows = []
+        for name, samples in sorted(snapshot.items()):
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+            rows.append({"stage": name, "count": len(samples), "p50": round(float(p50), 1), "p95": round(float(p95), 1), "p99": round(float(p99), 1)})
+        return rows
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+
+# Set TRACE_FILE to a path to log one JSON line per traced request
+tracer = Tracer(
+    window=int(os.environ.get("TRACE_WINDOW", 1000)),
+    sink_path=os.environ.get("TRACE_FILE"),
+)
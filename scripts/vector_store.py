@@ -1,14 +1,30 @@
 from qdrant_client import QdrantClient
 from qdrant_client import models
+import hashlib
+import json
+import os
+import threading
 import uuid
-from typing import List, Dict, Any
-from data_ingest import data_ingestion
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Set
+from data_ingest import iter_data_with_content_types
+from embedding_workers import EmbeddingPool
+from embedding_store import EmbeddingStore, text_hash
+from table_format import add_compact_tables, report_compaction
+from content_store import CONTENT_STORE_DIR, ContentStore, split_payload
+from collection_profiles import CollectionProfile, get_profile
+
+
+# Namespace for deterministic point ids, so re-indexing the same chunk always yields the same id
+POINT_ID_NAMESPACE = uuid.UUID("6f1c3a52-8d0e-4b9a-9a57-3c2f8e1d7b40")
 
 
 def create_collection(
     qdClient: QdrantClient,
     collection_name: str,
-    embedding_dimensionality: int = 512
+    embedding_dimensionality: int = 512,
+    profile: Optional[CollectionProfile] = None
 ):
     """
     Create a Qdrant collection with dense and sparse vectors.
@@ -17,22 +33,101 @@ def create_collection(
         qdClient: Qdrant client instance
         collection_name: Name of the collection to create
         embedding_dimensionality: Size of the dense vectors
+        profile: Quantization, HNSW and on-disk settings, defaults to Qdrant's defaults
+
+    Does nothing if the collection already exists.
     """
+    if qdClient.collection_exists(collection_name):
+        print(f"INFO: Collection '{collection_name}' already exists, reusing it")
+        return
+
+    profile = profile or get_profile(None)
     qdClient.create_collection(
         collection_name=collection_name,
         vectors_config={
             # Named dense vector for jinaai/jina-embeddings-v2-small-en
-            "jina-small": models.VectorParams(
-                size=embedding_dimensionality,
-                distance=models.Distance.COSINE,
-            ),
+            "jina-small": profile.vector_params(embedding_dimensionality),
         },
         sparse_vectors_config={
-            "bm25": models.SparseVectorParams(
-                modifier=models.Modifier.IDF,
-            )
-        }
+            "bm25": profile.sparse_vector_params(),
+        },
+        on_disk_payload=profile.on_disk_payload or None,
     )
+    print(f"SUCCESS: Created collection '{collection_name}' with the '{profile.name}' profile")
+
+
+# Payload fields that queries filter on, see RAG_pipeline.build_filter()
+INDEXED_PAYLOAD_FIELDS = ("content_type", "page_title", "section_title")
+
+
+def create_payload_indexes(
+    qdClient: QdrantClient,
+    collection_name: str,
+    fields: Iterable[str] = INDEXED_PAYLOAD_FIELDS
+):
+    """
+    Create keyword payload indexes, so filtered queries don't scan every payload.
+
+    Args:
+        qdClient: Qdrant client instance
+        collection_name: Name of the collection
+        fields: Payload keys to index
+
+    Indexes that already exist are left as they are.
+    """
+    schema = qdClient.get_collection(collection_name).payload_schema or {}
+    for field in fields:
+        if field in schema:
+            continue
+        qdClient.create_payload_index(
+            collection_name=collection_name,
+            field_name=field,
+            field_schema=models.PayloadSchemaType.KEYWORD,
+        )
+        print(f"SUCCESS: Created payload index on '{field}'")
+
+
+def content_hash(chunk: Dict[str, Any]) -> str:
+    """
+    Hash the full content of a chunk, so any change to its text, table or summary changes the hash.
+
+    Args:
+        chunk: Text or table document
+
+    Returns:
+        Hex SHA-256 digest of the chunk
+    """
+    serialized = json.dumps(chunk, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+def point_id(chunk: Dict[str, Any]) -> str:
+    """
+    Derive a deterministic point id from the page, section and content hash of a chunk.
+
+    Args:
+        chunk: Text or table document
+
+    Returns:
+        UUID string usable as a Qdrant point id
+    """
+    name = f"{chunk.get('page_title','')}\x00{chunk.get('section_title','')}\x00{content_hash(chunk)}"
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, name))
+
+
+def embedding_text(chunk: Dict[str, Any]) -> str:
+    """
+    Build the string that is embedded for a text or table chunk.
+
+    Args:
+        chunk: Text or table document with a content_type
+
+    Returns:
+        Text passed to the dense and sparse models
+    """
+    if chunk.get("content_type") == "table":
+        return f"Page title (2X importance): {chunk.get('page_title','')}. Section title: {chunk.get('section_title','')}. Table summary: {chunk.get('summary','')}"
+    return f"Page title (2X importance): {chunk.get('page_title','')}. Section title: {chunk.get('section_title','')}. text: {chunk.get('text','')}"
 
 
 def build_points(
@@ -58,9 +153,9 @@ def build_points(
     points = []
     
     for text in texts:
-        text_to_embedd = f"Page title (2X importance): {text.get('page_title','')}. Section title: {text.get('section_title','')}. text: {text.get('text','')}"
+        text_to_embedd = embedding_text({**text, "content_type": "text"})
         point = models.PointStruct(
-            id=uuid.uuid4().hex,
+            id=point_id(text),
             vector={
                 "jina-small": models.Document(
                     text=text_to_embedd,
@@ -76,9 +171,9 @@ def build_points(
         points.append(point)
 
     for table in tables:
-        text_to_embedd = f"Page title (2X importance): {table.get('page_title','')}. Section title: {table.get('section_title','')}. Table summary: {table.get('summary','')}"
+        text_to_embedd = embedding_text({**table, "content_type": "table"})
         point = models.PointStruct(
-            id=uuid.uuid4().hex,
+            id=point_id(table),
             vector={
                 "jina-small": models.Document(
                     text=text_to_embedd,
@@ -118,6 +213,211 @@ def batch_upsert(
         print(f"SUCCESS: Upserted {min(i+batch_size, total)}/{total}")
 
 
+def batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """
+    Group an iterable into lists of at most `size` items without materializing it.
+    """
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def stream_upsert(
+    qdClient: QdrantClient,
+    collection_name: str,
+    chunks: Iterable[Dict[str, Any]],
+    embedding_pool: EmbeddingPool,
+    batch_size: int = 256,
+    max_pending: Optional[int] = None,
+    upload_concurrency: int = 4,
+    embedding_store: Optional[EmbeddingStore] = None,
+    content_store: Optional[ContentStore] = None
+) -> int:
+    """
+    Embed and upsert a stream of chunks with bounded memory.
+
+    Chunks are grouped into batches that are embedded on the worker pool,
+    then uploaded by a small thread pool. At most `max_pending` batches are
+    being embedded and `upload_concurrency` batches uploaded at any time;
+    when either limit is reached, reading the input stream pauses.
+
+    With an embedding store, chunks whose embedded text was seen before are
+    served from disk and only the rest is sent to the workers.
+
+    With a content store, points only carry the lean payload (titles and
+    content type) and the heavy fields are written to the store first, so a
+    point never becomes searchable before its body can be fetched.
+
+    Args:
+        qdClient: Qdrant client instance
+        collection_name: Name of the collection
+        chunks: Iterable of text and table documents with content_type set
+        embedding_pool: Pool used to compute dense and sparse vectors
+        batch_size: Number of chunks embedded and upserted together
+        max_pending: Maximum batches being embedded, defaults to twice the worker count
+        upload_concurrency: Maximum concurrent upsert requests
+        embedding_store: Optional store of previously computed vectors
+        content_store: Optional store receiving the heavy payload fields
+
+    Returns:
+        Number of points upserted
+    """
+    if max_pending is None:
+        max_pending = 2 * max(1, embedding_pool.workers)
+
+    upload_slots = threading.Semaphore(upload_concurrency)
+    count_lock = threading.Lock()
+    upserted = 0
+    embedding = {}
+    uploads = set()
+
+    def upload(points, bodies):
+        nonlocal upserted
+        try:
+            if bodies:
+                content_store.put_many(bodies)
+            qdClient.upsert(collection_name=collection_name, points=points)
+            with count_lock:
+                upserted += len(points)
+                print(f"SUCCESS: Upserted {upserted} points")
+        finally:
+            upload_slots.release()
+
+    def schedule_upload(batch, vectors):
+        bodies = []
+        if content_store is not None:
+            split = [split_payload(chunk) for chunk in batch]
+            bodies = [(point_id(chunk), heavy) for chunk, (_, heavy) in zip(batch, split)]
+            payloads = [lean for lean, _ in split]
+        else:
+            payloads = batch
+
+        points = [
+            models.PointStruct(
+                id=point_id(chunk),
+                vector={
+                    "jina-small": dense.tolist(),
+                    "bm25": models.SparseVector(
+                        indices=sparse[0].tolist(),
+                        values=sparse[1].tolist(),
+                    ),
+                },
+                payload=payload
+            )
+            for chunk, payload, (dense, sparse) in zip(batch, payloads, vectors)
+        ]
+        # Blocks while all upload slots are busy, which in turn stops reading new chunks
+        upload_slots.acquire()
+        uploads.add(uploader.submit(upload, points, bodies))
+
+        for future in [future for future in uploads if future.done()]:
+            uploads.discard(future)
+            future.result()
+
+    def submit(batch):
+        texts = [embedding_text(chunk) for chunk in batch]
+        if embedding_store is None:
+            embedding[embedding_pool.submit(texts)] = (batch, None, None)
+            return
+
+        keys = [text_hash(text) for text in texts]
+        stored = embedding_store.get_many(keys)
+        missing = [i for i, vectors in enumerate(stored) if vectors is None]
+        if not missing:
+            schedule_upload(batch, stored)
+            return
+        future = embedding_pool.submit([texts[i] for i in missing])
+        embedding[future] = (batch, keys, stored)
+
+    def collect(return_when):
+        done, _ = wait(embedding, return_when=return_when)
+        for future in done:
+            batch, keys, stored = embedding.pop(future)
+            dense, sparse = future.result()
+            if stored is None:
+                vectors = [(dense[i], sparse[i]) for i in range(len(batch))]
+            else:
+                # Fill the store misses in order and persist them for the next run
+                missing = [i for i, vectors in enumerate(stored) if vectors is None]
+                embedding_store.put_many([keys[i] for i in missing], dense, sparse)
+                vectors = list(stored)
+                for j, i in enumerate(missing):
+                    vectors[i] = (dense[j], sparse[j])
+            schedule_upload(batch, vectors)
+
+    with ThreadPoolExecutor(max_workers=upload_concurrency) as uploader:
+        for batch in batched(chunks, batch_size):
+            submit(batch)
+            if len(embedding) >= max_pending:
+                collect(FIRST_COMPLETED)
+
+        while embedding:
+            collect(FIRST_COMPLETED)
+
+        for future in uploads:
+            future.result()
+
+    return upserted
+
+
+def existing_point_ids(
+    qdClient: QdrantClient,
+    collection_name: str,
+    batch_size: int = 1000
+) -> Set[str]:
+    """
+    Collect the ids of every point in a collection without fetching payloads or vectors.
+
+    Args:
+        qdClient: Qdrant client instance
+        collection_name: Name of the collection
+        batch_size: Number of ids fetched per scroll request
+
+    Returns:
+        Set of point ids as strings
+    """
+    ids = set()
+    offset = None
+    while True:
+        records, offset = qdClient.scroll(
+            collection_name=collection_name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=False,
+            with_vectors=False,
+        )
+        ids.update(str(record.id) for record in records)
+        if offset is None:
+            return ids
+
+
+def delete_points(
+    qdClient: QdrantClient,
+    collection_name: str,
+    ids: List[str],
+    batch_size: int = 1000
+):
+    """
+    Delete points by id in batches.
+
+    Args:
+        qdClient: Qdrant client instance
+        collection_name: Name of the collection
+        ids: Point ids to delete
+        batch_size: Size of each batch
+    """
+    total = len(ids)
+    for i in range(0, total, batch_size):
+        qdClient.delete(
+            collection_name=collection_name,
+            points_selector=models.PointIdsList(points=ids[i:i+batch_size]),
+        )
+        print(f"SUCCESS: Deleted {min(i+batch_size, total)}/{total}")
+
+
 def vector_store_pipeline(
     url: str = "http://localhost:6333",
     collection_name: str = "stardew-sparse-and-dense",
@@ -126,10 +426,27 @@ def vector_store_pipeline(
     sparse_model_handle: str = "Qdrant/bm25",
     texts_path: str = "data/summarized_texts.json",
     tables_path: str = "data/summarized_tables.json",
-    batch_size: int = 1000
+    batch_size: int = 256,
+    sync: bool = True,
+    recreate: bool = False,
+    workers: Optional[int] = None,
+    upload_concurrency: int = 4,
+    embedding_store_dir: Optional[str] = "data/embeddings",
+    content_store_dir: Optional[str] = CONTENT_STORE_DIR,
+    profile: Optional[str] = None
 ):
     """
     Complete vector store pipeline using URL parameter.
+
+    Point ids are derived from page, section and content hash, so the pipeline
+    is idempotent. In sync mode only new or changed chunks are embedded and
+    upserted, and points whose source chunk disappeared are deleted.
+
+    The corpus is streamed from disk, embedded in batches on a pool of worker
+    processes and uploaded concurrently, so memory stays flat regardless of
+    corpus size. Computed vectors are kept in a local embedding store keyed
+    by content hash and model handles, so rebuilding a collection with new
+    settings or under a new name only reads vectors back from disk.
     
     Args:
         url: Qdrant server URL 
@@ -139,27 +456,80 @@ def vector_store_pipeline(
         sparse_model_handle: Model handle for sparse vectors
         texts_path: Path to texts JSON file
         tables_path: Path to tables JSON file
-        batch_size: Batch size for upserting
+        batch_size: Number of chunks embedded and upserted per batch
+        sync: Only embed new or changed chunks and delete stale points
+        recreate: Drop the collection first and rebuild it from scratch
+        workers: Embedding worker processes, defaults to the number of CPUs (0 embeds in-process)
+        upload_concurrency: Maximum concurrent upsert requests
+        embedding_store_dir: Directory of the local embedding store, None disables it
+        content_store_dir: Directory of the content store (`<collection_name>.db`) receiving the
+            heavy payload fields, so Qdrant only stores titles and content type; None keeps
+            full payloads in Qdrant
+        profile: Name of the collection profile used when the collection is created
+            (see collection_profiles.COLLECTION_PROFILES), defaults to COLLECTION_PROFILE
+            or Qdrant's defaults
         
     Returns:
         QdrantClient instance and collection name
     """
     # Initialize Qdrant client with URL
     qdClient = QdrantClient(url=url)
+
+    if recreate and qdClient.collection_exists(collection_name):
+        qdClient.delete_collection(collection_name)
+        print(f"INFO: Dropped collection '{collection_name}'")
     
     # Create collection
-    create_collection(qdClient, collection_name, embedding_dimensionality)
-    
-    # Load data with content types
-    texts, tables = data_ingestion(texts_path, tables_path)
-    
-    # Build points
-    points = build_points(texts, tables, vector_model_handle, sparse_model_handle, embedding_dimensionality)
-    
-    # Batch upsert
-    batch_upsert(qdClient, collection_name, points, batch_size)
+    create_collection(qdClient, collection_name, embedding_dimensionality, get_profile(profile or os.environ.get("COLLECTION_PROFILE")))
+    create_payload_indexes(qdClient, collection_name)
+
+    # Diff the corpus against the collection by deterministic id while streaming it
+    existing_ids = existing_point_ids(qdClient, collection_name) if sync else set()
+    # Points without a stored body (e.g. ingested with full payloads) are re-upserted lean
+    up_to_date_ids = existing_ids
+
+    content_store = None
+    if content_store_dir:
+        content_store = ContentStore(os.path.join(content_store_dir, f"{collection_name}.db"))
+        up_to_date_ids = existing_ids & content_store.ids()
+    current_ids = set()
+
+    # Tables get a compact markdown form next to their HTML, which build_prompt prefers
+    table_stats = {}
+
+    def new_chunks():
+        for chunk in add_compact_tables(iter_data_with_content_types(texts_path, tables_path), table_stats):
+            chunk_id = point_id(chunk)
+            current_ids.add(chunk_id)
+            if chunk_id not in up_to_date_ids:
+                yield chunk
+
+    embedding_store = None
+    if embedding_store_dir:
+        embedding_store = EmbeddingStore(embedding_store_dir, vector_model_handle, sparse_model_handle, embedding_dimensionality)
+        print(f"INFO: Embedding store at '{embedding_store.path}' holds {len(embedding_store)} vectors")
+
+    with EmbeddingPool(vector_model_handle, sparse_model_handle, workers) as embedding_pool:
+        upserted = stream_upsert(
+            qdClient,
+            collection_name,
+            new_chunks(),
+            embedding_pool,
+            batch_size=batch_size,
+            upload_concurrency=upload_concurrency,
+            embedding_store=embedding_store,
+            content_store=content_store,
+        )
+
+    report_compaction(table_stats)
+
+    # Stale points are removed only after their replacements are in, so search never sees a gap
+    stale_ids = sorted(existing_ids - current_ids)
+    delete_points(qdClient, collection_name, stale_ids)
+    if content_store is not None:
+        content_store.delete_many(sorted(content_store.ids() - current_ids))
     
-    print(f"SUCCESS: Ingested {len(points)} points into collection '{collection_name}'")
+    print(f"SUCCESS: Ingested {upserted} new or changed points into collection '{collection_name}' ({len(stale_ids)} stale points removed)")
     
     return qdClient, collection_name
 